@@ -0,0 +1,210 @@
+from collections import defaultdict, OrderedDict
+from search import BranchAndBound
+from deadline import SearchStopped
+
+'''
+    Branch-and-bound search with conflict-directed backjumping and nogood learning.
+
+    On tight instances a chronological search finds the same dead end over and over: e.g. two groups at the
+    same time whose only TA left has one shift left fail again for every value of every group that was
+    assigned after them. This search records why every TA is removed from a group (the explanation: the
+    appointed groups that removed it), and when a group has no TAs left it combines the explanations into the
+    conflict set of the dead end. It then jumps back to the last group in the conflict set, skipping the groups
+    in between, since other values for those can't solve the dead end (conflict-directed backjumping).
+
+    The conflict set of a group for which every TA fails is also learned as a nogood: the TAs of the groups in
+    the conflict set can't be combined in any schedule. Nogoods are checked when a TA is appointed, so the
+    same dead end is recognised at once in other parts of the search tree. Only small nogoods are learned,
+    and the least recently used nogoods are forgotten when there are more than max_nogoods.
+
+    Pruning on the score of the best schedule so far (the bounds in *search.py*) depends on the whole partial
+    schedule, so after such a pruning the search backtracks chronologically and learns nothing.
+'''
+
+MAX_NOGOODS = 10000
+MAX_NOGOOD_SIZE = 8
+
+
+class SolutionFound(SearchStopped):
+    """
+    raised to end the search at the first schedule
+    """
+
+
+class ConflictDirectedSearch(BranchAndBound):
+    """
+    branch-and-bound search (see *search.py*) that jumps back to the cause of a dead end and learns nogoods
+    """
+    def __init__(self, model, progress=None, deadline=None, max_nogoods=MAX_NOGOODS, max_nogood_size=MAX_NOGOOD_SIZE):
+        """
+        max_nogoods: number of nogoods that are kept, max_nogood_size: number of groups of the largest nogood
+        """
+        super().__init__(model, progress, deadline)
+        self.max_nogoods = max_nogoods
+        self.max_nogood_size = max_nogood_size
+        self.scope = defaultdict(list)
+        for group, values in self.values.items():
+            for person in values:
+                self.scope[person].append(group)
+
+    def solve(self, incumbent_score=None, first=False):
+        """
+        run the search as BranchAndBound.solve, or stop at the first schedule that is better than
+        incumbent_score if first
+        """
+        self.first = first
+        # explanation (appointed groups) of every TA that is removed from an open group
+        self.removed = defaultdict(dict)
+        # nogood (frozenset of (group, TA)) -> groups, least recently used first
+        self.nogoods = OrderedDict()
+        self.watches = defaultdict(list)
+        self.inexact = 0  # number of leaves and prunings on the bounds
+        self.backjumps = 0
+        self.learned = 0
+        self.nogood_prunings = 0
+        return super().solve(incumbent_score)
+
+    def first_solution(self, consecutive_ratio=None):
+        """
+        first schedule for which the number of consecutive groups divided by the number of TAs with
+        more than 1 shift is larger than consecutive_ratio (as ConsecutiveRatioConstraint in *scheduler.py*)
+        """
+        incumbent_score = None
+        n_plus1shift = self.model.n_plus1shift
+        if consecutive_ratio is not None and n_plus1shift > 0:
+            too_few = max(count for count in range(len(self.consecutive_groups) + 1)
+                          if count / n_plus1shift <= consecutive_ratio)
+            # with a 'Preferably Not' count of -1, a schedule needs more consecutive groups to be better
+            incumbent_score = (too_few, -1)
+        return self.solve(incumbent_score, first=True)
+
+    ### search ###
+    def _search(self, depth):
+        """
+        search below the current partial schedule, returns the conflict set: the appointed groups
+        that have to change before the groups below can be solved
+        """
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        if depth == len(self.order):
+            self._record()
+            if self.first:
+                raise SolutionFound()
+            self.inexact += 1
+            return set(self.assignments)
+        if not self._can_improve():
+            self.inexact += 1
+            return set(self.assignments)
+
+        inexact = self.inexact
+        group = self._select_group()
+        values = self._order_values(group)
+        n_values = len(values)
+        conflict = set()
+        for person in values:
+            if self.progress is not None:
+                self.progress.node(depth, n_values)
+            nogood = self._violated_nogood(group, person)
+            if nogood is not None:
+                self.nogood_prunings += 1
+                conflict |= nogood
+                continue
+            trail = []
+            explanation = self._assign(group, person, trail)
+            if explanation is None:
+                explanation = self._search(depth + 1)
+            self._unassign(group, person, trail)
+            if group not in explanation:
+                # no other TA for this group can solve the dead end below
+                self.backjumps += 1
+                return explanation
+            conflict |= explanation
+
+        conflict.discard(group)
+        for explanation in self.removed[group].values():
+            conflict |= explanation
+        if self.inexact == inexact:
+            self._learn(conflict)
+        return conflict
+
+    def _assign(self, group, person, trail):
+        """
+        appoint person to group and forward check the open groups, as BranchAndBound._assign.
+        Returns None, or the conflict set on a dead end
+        """
+        self.assignments[group] = person
+        self.count[person] += 1
+        for value in self.domains[group]:
+            self.support[value] -= 1
+        self.consecutive_count += self._consecutive_with(group, person)
+        self.preferably_not_count += (group, person) in self.preferably_not
+
+        touched = set(self.domains[group])
+        if self.count[person] == self.n_shifts[person]:
+            neighbours = [other for other in self.order if other not in self.assignments]
+            reason = frozenset(other for other, value in self.assignments.items() if value == person)
+        elif self.model.is_pooled(person):
+            neighbours = []
+            reason = None
+        else:
+            neighbours = [other for other in self.conflicts[group] if other not in self.assignments]
+            reason = frozenset((group,))
+        for other in neighbours:
+            if person in self.domains[other]:
+                self.domains[other].discard(person)
+                self.support[person] -= 1
+                self.removed[other][person] = reason
+                trail.append(other)
+                if not self.domains[other]:
+                    return set().union(*self.removed[other].values())
+        touched.add(person)
+        for value in touched:
+            if self.count[value] + self.support[value] < self.n_shifts[value]:
+                return self._capacity_explanation(value)
+        return None
+
+    def _unassign(self, group, person, trail):
+        for other in trail:
+            del self.removed[other][person]
+        super()._unassign(group, person, trail)
+
+    def _capacity_explanation(self, person):
+        """
+        conflict set of a TA that can't get their number of shifts anymore: the groups of the TA
+        that are appointed to another TA, and the explanations of the groups the TA was removed from
+        """
+        conflict = set()
+        for group in self.scope[person]:
+            if group in self.assignments:
+                if self.assignments[group] != person:
+                    conflict.add(group)
+            elif person not in self.domains[group]:
+                conflict |= self.removed[group][person]
+        return conflict
+
+    ### nogoods ###
+    def _learn(self, conflict):
+        if not conflict or len(conflict) > self.max_nogood_size:
+            return
+        nogood = frozenset((group, self.assignments[group]) for group in conflict)
+        if nogood in self.nogoods:
+            return
+        self.nogoods[nogood] = frozenset(conflict)
+        for literal in nogood:
+            self.watches[literal].append(nogood)
+        self.learned += 1
+        if len(self.nogoods) > self.max_nogoods:
+            forgotten, _ = self.nogoods.popitem(last=False)
+            for literal in forgotten:
+                self.watches[literal].remove(forgotten)
+
+    def _violated_nogood(self, group, person):
+        """
+        groups of a nogood that appointing person to group would complete, or None
+        """
+        for nogood in self.watches[(group, person)]:
+            if all(self.assignments.get(other) == value for other, value in nogood if other != group):
+                self.nogoods.move_to_end(nogood)
+                return self.nogoods[nogood] - {group}
+        return None
@@ -0,0 +1,210 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import multiprocessing
+import pandas as pd
+from scheduler import generate_schedule
+from workbooks import read_availability
+
+'''
+    Headless batch run: schedules many workbooks (e.g. all courses and blocks) in one go, without questions.
+
+        python batch.py availability/ --workers 4 --output-dir schedules
+        python batch.py manifest.json --engine cbj --time-limit 600
+
+    The input is a directory (every .xlsx workbook in it is scheduled, and every .csv, .parquet or .arrow file
+    with the same columns, see *workbooks.py*) or a manifest: a JSON list of objects, or a CSV file with one row
+    per workbook, with the path of the workbook and any parameters of generate_schedule (see *scheduler.py*)
+    for that workbook, e.g.
+
+        [{"path": "statistics_1a.xlsx", "min_availability_ratio": 0.3},
+         {"path": "statistics_1b.xlsx", "suffix": "1b", "engine": "flow"}]
+
+    Paths of workbooks are relative to the manifest, cache_dir and progress_log to the current directory.
+    Parameters that a workbook doesn't set are taken from the command line, and the suffix defaults to the name
+    of the workbook. TAs can only be merged automatically (merge='auto'), since nobody answers questions.
+    The workbooks are scheduled in parallel in a pool of worker processes, and every schedule is written to
+    output/ of the output directory together with the log of its run. A workbook that can't be scheduled is
+    reported as failed and doesn't stop the others. At the end a summary of all workbooks is written to
+    output/batch_summary.csv, and the exit code is 1 if any workbook failed.
+'''
+
+# parameters of generate_schedule that can be set per workbook
+PARAMETERS = ('suffix', 'required_columns', 'min_availability_ratio', 'consecutive_ratio', 'engine', 'merge',
+              'cache_dir', 'time_limit', 'progress_log')
+# files in an input directory that are scheduled, see *workbooks.py*
+INPUT_EXTENSIONS = ('.xlsx', '.csv', '.parquet', '.arrow', '.feather')
+
+
+def read_manifest(path):
+    """
+    list of (workbook path, parameters) of a manifest (.json or .csv), paths relative to the manifest
+    """
+    if path.lower().endswith('.json'):
+        with open(path) as file:
+            entries = json.load(file)
+    else:
+        entries = [{key: value for key, value in row.items() if not pd.isna(value)}
+                   for row in pd.read_csv(path).to_dict('records')]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for entry in entries:
+        entry = dict(entry)
+        if 'path' not in entry:
+            sys.exit(f'Every workbook in the manifest "{path}" needs a path')
+        workbook = os.path.join(directory, str(entry.pop('path')))
+        jobs.append((workbook, entry))
+    return jobs
+
+
+def find_workbooks(directory):
+    """
+    list of (workbook path, no parameters) of the workbooks (or .csv, .parquet, .arrow files) in directory
+    """
+    return [(os.path.join(directory, name), {}) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith('~$')]  # ~$: lock file of an open workbook
+
+
+def job_parameters(workbook, parameters, defaults):
+    """
+    parameters of generate_schedule for a workbook: its own parameters, completed with the defaults
+    """
+    unknown = set(parameters) - set(PARAMETERS) - {'sheet'}
+    if unknown:
+        raise ValueError(f"unknown parameters {sorted(unknown)}")
+    parameters = {**defaults, **parameters}
+    if parameters.get('merge') not in (None, 'auto'):
+        raise ValueError("TAs can only be merged automatically in a batch run (merge='auto')")
+    parameters.setdefault('suffix', os.path.splitext(os.path.basename(workbook))[0])
+    parameters['suffix'] = str(parameters['suffix'])
+    if 'required_columns' in parameters:
+        parameters['required_columns'] = int(parameters['required_columns'])
+    # run_job changes the current directory to the output directory
+    for name in ('cache_dir', 'progress_log'):
+        if parameters.get(name) is not None:
+            parameters[name] = os.path.abspath(parameters[name])
+    return parameters
+
+
+def run_job(job):
+    """
+    schedule one workbook, returns its row of the summary. The run is logged to output/log_<suffix>.txt,
+    and errors (sys.exit in the scheduler or any exception) are reported in the row instead of raised
+    """
+    index, workbook, parameters, output_dir = job
+    start = time.time()
+    row = {"index": index, "workbook": workbook, "suffix": parameters['suffix'], "status": "failed",
+           "optimal": None, "seconds": None, "message": ""}
+    log = io.StringIO()
+    cwd = os.getcwd()
+    try:
+        parameters = dict(parameters)
+        sheet = parameters.pop('sheet', 0)
+        df = read_availability(workbook, sheet_name=sheet)
+        # generate_schedule writes to output/ of the current directory
+        os.chdir(output_dir)
+        with contextlib.redirect_stdout(log):
+            result = generate_schedule(df, **parameters, n_workers=1)
+        row.update(status="ok", optimal=bool(result.attrs.get("optimal")), message="")
+    except SystemExit as error:
+        row["message"] = str(error.code)
+    except Exception as error:
+        row["message"] = f"{type(error).__name__}: {error}"
+    finally:
+        os.chdir(cwd)
+        row["seconds"] = round(time.time() - start, 2)
+
+    log_dir = os.path.join(output_dir, 'output')
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, f'log_{row["suffix"]}.txt'), 'w') as file:
+        file.write(log.getvalue())
+        if row["message"]:
+            file.write(f'{row["message"]}\n')
+    return row
+
+
+def run_batch(jobs, defaults=None, output_dir='.', n_workers=1):
+    """
+    schedule the workbooks of jobs (list of (workbook path, parameters)) with n_workers processes
+    (None uses all cores), returns the summary as a DataFrame with a row per workbook
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    rows = []
+    for index, (workbook, parameters) in enumerate(jobs):
+        workbook = os.path.abspath(workbook)
+        try:
+            parameters = job_parameters(workbook, parameters, defaults or {})
+        except ValueError as error:
+            suffix = parameters.get('suffix', os.path.splitext(os.path.basename(workbook))[0])
+            rows.append({"index": index, "workbook": workbook, "suffix": suffix,
+                         "status": "failed", "optimal": None, "seconds": 0.0, "message": str(error)})
+            continue
+        tasks.append((index, workbook, parameters, output_dir))
+
+    suffixes = [parameters['suffix'] for _, _, parameters, _ in tasks]
+    duplicates = sorted({suffix for suffix in suffixes if suffixes.count(suffix) > 1})
+    if duplicates:
+        sys.exit(f"Workbooks would overwrite each other's schedule, give them different suffixes: {duplicates}")
+
+    def report(row):
+        print(f'{row["suffix"]}: {row["status"]} in {row["seconds"]:.1f} seconds'
+              + (f' ({row["message"]})' if row["message"] else ''))
+        rows.append(row)
+
+    n_workers = min(n_workers or os.cpu_count(), max(len(tasks), 1))
+    if n_workers == 1:
+        for task in tasks:
+            report(run_job(task))
+    else:
+        with multiprocessing.Pool(n_workers) as pool:
+            for row in pool.imap_unordered(run_job, tasks):
+                report(row)
+
+    summary = pd.DataFrame(rows, columns=["index", "workbook", "suffix", "status", "optimal", "seconds", "message"])
+    return summary.sort_values("index").drop(columns="index").reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="schedule many workbooks without questions")
+    parser.add_argument('input', help="directory with .xlsx workbooks (or .csv, .parquet, .arrow files), "
+                                      "or a manifest (.json or .csv)")
+    parser.add_argument('--output-dir', default='.', help="schedules are written to output/ of this directory")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument('--engine', choices=('auto', 'bnb', 'csp', 'flow', 'lns', 'cbj'))
+    parser.add_argument('--required-columns', type=int)
+    parser.add_argument('--min-availability-ratio', type=float,
+                        help="decrease 'Preferably Not' with this ratio if the search would take too long")
+    parser.add_argument('--merge', choices=('auto',), help="merge TAs if the search would take too long")
+    parser.add_argument('--consecutive-ratio', type=float)
+    parser.add_argument('--time-limit', type=float, help="seconds per workbook")
+    parser.add_argument('--cache-dir')
+    args = parser.parse_args(argv)
+
+    defaults = {name: getattr(args, name) for name in ('engine', 'required_columns', 'min_availability_ratio',
+                                                        'merge', 'consecutive_ratio', 'time_limit', 'cache_dir')
+                if getattr(args, name) is not None}
+    if os.path.isdir(args.input):
+        jobs = find_workbooks(args.input)
+    else:
+        jobs = read_manifest(args.input)
+    if not jobs:
+        sys.exit(f'No workbooks found in "{args.input}"')
+
+    summary = run_batch(jobs, defaults, args.output_dir, args.workers)
+    os.makedirs(os.path.join(args.output_dir, 'output'), exist_ok=True)
+    summary_path = os.path.join(args.output_dir, 'output', 'batch_summary.csv')
+    summary.to_csv(summary_path, index=False)
+    n_failed = int((summary["status"] != "ok").sum())
+    print(f'{len(summary) - n_failed} of {len(summary)} workbooks scheduled, summary written to "{summary_path}"')
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
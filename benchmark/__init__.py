@@ -0,0 +1,8 @@
+'''
+    Benchmarks for the scheduler: a generator for synthetic dataframes (*generator.py*) and a runner that
+    times every stage of generate_schedule on them and writes the results to JSON (*runner.py*).
+
+    Run from the root of the repository, e.g.:
+        python -m benchmark.runner --sizes 10x6 13x9 16x9 --seeds 0 1 2 --engines bnb flow
+'''
+from benchmark.generator import generate_instance
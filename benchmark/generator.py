@@ -0,0 +1,99 @@
+import sys
+import random
+import pandas as pd
+
+'''
+    Generator for synthetic dataframes in the format of generate_schedule (see *scheduler.py*).
+
+    Groups are placed on a grid of days x time slots (of 2 hours, from 09:00) x rooms. The next group is
+    placed directly after a previous group in the same room with probability p_consecutive, at the same
+    time as a previous group in another room with probability p_clash, and in a random free place otherwise.
+    The same seed always gives the same dataframe.
+'''
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+COLUMNS = ['Day', 'Time', 'Group', 'Location', 'Room']
+
+
+def distribute_shifts(n_groups, n_tas, distribution, rng):
+    """
+    number of shifts per TA, adding up to n_groups. distribution: 'random' (every TA has at least 1 shift,
+    the other shifts go to random TAs), 'even' (as equal as possible) or a list with the number of shifts
+    """
+    if isinstance(distribution, (list, tuple)):
+        if len(distribution) != n_tas or sum(distribution) != n_groups:
+            sys.exit("shift distribution must have a number of shifts for every TA, adding up to the number of groups")
+        return list(distribution)
+    if n_tas > n_groups:
+        sys.exit("there can't be more TAs than groups")
+    if distribution == 'even':
+        return [n_groups // n_tas + (i < n_groups % n_tas) for i in range(n_tas)]
+    if distribution == 'random':
+        shifts = [1] * n_tas
+        for _ in range(n_groups - n_tas):
+            shifts[rng.randrange(n_tas)] += 1
+        return shifts
+    sys.exit("shift distribution must be 'random', 'even' or a list")
+
+
+def place_groups(n_groups, n_days, slots_per_day, n_rooms, p_consecutive, p_clash, rng):
+    """
+    (day, slot, room) of every group
+    """
+    free = {(day, slot, room) for day in range(n_days) for slot in range(slots_per_day) for room in range(n_rooms)}
+    if len(free) < n_groups:
+        sys.exit("not enough days, time slots and rooms for the number of groups")
+
+    placed = []
+    for _ in range(n_groups):
+        options = []
+        draw = rng.random()
+        if placed and draw < p_consecutive:
+            options = [(day, slot + 1, room) for day, slot, room in placed if (day, slot + 1, room) in free]
+        elif placed and draw < p_consecutive + p_clash:
+            options = [(day, slot, other) for day, slot, room in placed for other in range(n_rooms)
+                       if (day, slot, other) in free]
+        if not options:
+            options = sorted(free)
+        place = rng.choice(sorted(options))
+        free.discard(place)
+        placed.append(place)
+    return placed
+
+
+def generate_instance(n_groups=12, n_tas=6, seed=0, shift_distribution='random', p_yes=0.45,
+                      p_preferably_not=0.2, n_days=3, slots_per_day=4, n_rooms=2, p_consecutive=0.3,
+                      p_clash=0.2):
+    """
+    generate a dataframe with n_groups groups and n_tas TAs.
+    p_yes, p_preferably_not: probability of 'Yes' and 'Preferably Not' for every group and TA (else 'No').
+    Every group gets at least one 'Yes' and every TA at least as many available groups as shifts
+    """
+    if n_days > len(DAYS):
+        sys.exit(f"there can be at most {len(DAYS)} days")
+    rng = random.Random(seed)
+    shifts = distribute_shifts(n_groups, n_tas, shift_distribution, rng)
+    places = place_groups(n_groups, n_days, slots_per_day, n_rooms, p_consecutive, p_clash, rng)
+
+    availability = []
+    for _ in range(n_groups):
+        row = []
+        for _ in range(n_tas):
+            draw = rng.random()
+            row.append('Yes' if draw < p_yes else 'Preferably Not' if draw < p_yes + p_preferably_not else 'No')
+        if 'Yes' not in row:
+            row[rng.randrange(n_tas)] = 'Yes'
+        availability.append(row)
+    for ta in range(n_tas):
+        unavailable = [group for group in range(n_groups) if availability[group][ta] == 'No']
+        rng.shuffle(unavailable)
+        while n_groups - len(unavailable) < shifts[ta]:
+            availability[unavailable.pop()][ta] = 'Yes'
+
+    rows = []
+    for group, (day, slot, room) in enumerate(places):
+        start = 9 + 2 * slot
+        rows.append([DAYS[day], f'{start:02d}:00-{start + 2:02d}:00', f'G{group + 1}', 'Location', f'Room {room + 1}']
+                    + availability[group])
+    columns = COLUMNS + [f'TA{ta + 1}_{n_shifts}' for ta, n_shifts in enumerate(shifts)]
+    return pd.DataFrame(rows, columns=columns)
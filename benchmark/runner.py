@@ -0,0 +1,192 @@
+import io
+import os
+import json
+import time
+import argparse
+import platform
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scheduler
+from symmetry import split_pooled
+from feasibility import count_values
+from progress import SearchProgress
+from deadline import Deadline
+from estimate import choose_strategy, DEFAULT_TIME_BUDGET
+from benchmark.generator import generate_instance
+
+'''
+    Benchmark runner: runs generate_schedule (see *scheduler.py*) stage by stage on generated instances
+    (see *generator.py*), with the functions of the scheduler itself, and records for every stage the time and
+    the peak memory, and for the search the number of search nodes and solutions and the quality of the schedule.
+    As in generate_schedule, the lossy fallbacks (merging TAs, decreasing 'Preferably Not') only run when they are
+    switched on and the search is predicted not to fit in the time limit, and nothing is written to Excel.
+    The results are written to JSON, together with the version of the code, so engines and versions can be
+    compared on the same seeded instances.
+'''
+
+ENGINES = ('auto', 'bnb', 'csp', 'flow', 'lns', 'cbj')
+
+
+class StageTimer:
+    """
+    time and peak memory (with tracemalloc, if track_memory) of the stages of a run
+    """
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        measure a stage, the times of a stage that runs more than once are added up
+        """
+        if self.track_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"seconds": 0.0})
+            stage["seconds"] += time.perf_counter() - start
+            if self.track_memory:
+                peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                stage["peak_memory_mb"] = max(stage.get("peak_memory_mb", 0.0), peak)
+
+
+def run_instance(df, engine='auto', required_columns=9, min_availability_ratio=None, merge=None,
+                 consecutive_ratio=0.4, time_limit=10.0, track_memory=True):
+    """
+    run the stages of generate_schedule on the dataframe, with the parameters of generate_schedule (merge: None
+    or 'auto'), on 1 core and without cache. Returns a dictionary with the results
+    """
+    timer = StageTimer(track_memory)
+    result = {"engine": engine, "n_groups": int(df.shape[0]), "n_tas": int(df.shape[1] - 5)}
+    if track_memory:
+        tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = df.copy()
+            deadline = Deadline(time_limit=time_limit)
+            with timer.stage("check"):
+                scheduler.check_input_range(df)
+                scheduler.check_structure(df)
+            try:
+                model, pools, estimate, fallbacks = scheduler.preprocess(df, required_columns, min_availability_ratio,
+                                                                         merge, deadline, stage=timer.stage,
+                                                                         dominance=engine != 'flow')
+            except SystemExit:
+                result["status"] = "infeasible"
+                return result
+            result.update({"tas_merged": len(fallbacks["merge_log"]),
+                           "preferably_not_removed": fallbacks["preferably_not_removed"],
+                           "pooled_tas": len(pools), "values_left": count_values(model),
+                           "log10_domain_product": estimate["log10_domain_product"]})
+
+            search_engine, all_solutions = choose_strategy(estimate, deadline.remaining(default=DEFAULT_TIME_BUDGET),
+                                                           engine)
+            if not all_solutions:
+                predicted_seconds = estimate["first_seconds"]
+            elif search_engine == 'csp':
+                predicted_seconds = estimate["enumeration_seconds"]
+            else:
+                predicted_seconds = estimate["exhaustive_seconds"]
+            result.update({"search_engine": search_engine, "all_solutions": all_solutions,
+                           "predicted_seconds": predicted_seconds})
+            # nodes are counted as in generate_schedule with a progress callback
+            progress = SearchProgress()
+            with timer.stage("search"):
+                solution = scheduler.extract_schedule(model, all_solutions, consecutive_ratio, search_engine,
+                                                      progress=progress, deadline=deadline)
+            result.update({"nodes": progress.nodes, "solutions": progress.solutions, "stopped": deadline.stopped})
+            if not solution:
+                result["status"] = "no solution"
+                return result
+            consecutive_count, preferably_not_count = scheduler.score_solution(solution, model)
+            with timer.stage("output"):
+                solution = split_pooled({group: solution[group] for group in model.groups}, pools)
+                scheduler.dict_to_dataframe(solution, df)
+        result.update({"status": "solved", "consecutive_shift_count": consecutive_count,
+                       "preferably_not_count": preferably_not_count})
+        return result
+    finally:
+        result["stages"] = timer.stages
+        result["seconds"] = sum(stage["seconds"] for stage in timer.stages.values())
+        if track_memory:
+            result["peak_memory_mb"] = max((stage["peak_memory_mb"] for stage in timer.stages.values()), default=0.0)
+            tracemalloc.stop()
+
+
+def run_benchmark(sizes, seeds, engines=('auto',), instance_options=None, **run_options):
+    """
+    run every engine on a generated instance for every size (n_groups, n_tas) and seed,
+    returns a list with the results of every run
+    """
+    results = []
+    for n_groups, n_tas in sizes:
+        for seed in seeds:
+            df = generate_instance(n_groups, n_tas, seed=seed, **(instance_options or {}))
+            for engine in engines:
+                result = run_instance(df, engine=engine, **run_options)
+                result["seed"] = seed
+                results.append(result)
+                print(f"{n_groups} groups, {n_tas} TAs, seed {seed}, {engine}: {result['status']} "
+                      f"in {result['seconds']:.2f} seconds")
+    return results
+
+
+def version():
+    """
+    git commit of the code (if available) and versions of Python and the packages
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(scheduler.__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "machine": platform.machine(), "cpu_count": os.cpu_count()}
+
+
+def parse_size(text):
+    n_groups, n_tas = text.lower().split('x')
+    return int(n_groups), int(n_tas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the scheduler on generated instances")
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(10, 6), (13, 9), (16, 9)],
+                        help="instance sizes as GROUPSxTAS (default: 10x6 13x9 16x9)")
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=['auto'])
+    parser.add_argument('--p-yes', type=float, default=0.45)
+    parser.add_argument('--p-preferably-not', type=float, default=0.2)
+    parser.add_argument('--n-rooms', type=int, default=2)
+    parser.add_argument('--n-days', type=int, default=3)
+    parser.add_argument('--slots-per-day', type=int, default=4)
+    parser.add_argument('--shift-distribution', choices=('random', 'even'), default='random')
+    parser.add_argument('--min-availability-ratio', type=float, default=None,
+                        help="decrease 'Preferably Not' with this ratio (default: don't)")
+    parser.add_argument('--merge', choices=('auto',), help="merge TAs automatically if the search would take too long")
+    parser.add_argument('--consecutive-ratio', type=float, default=0.4)
+    parser.add_argument('--time-limit', type=float, default=10.0, help="time limit of every run in seconds")
+    parser.add_argument('--no-memory', action='store_true', help="don't track memory (tracemalloc slows down)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    instance_options = {"p_yes": args.p_yes, "p_preferably_not": args.p_preferably_not, "n_rooms": args.n_rooms,
+                        "n_days": args.n_days, "slots_per_day": args.slots_per_day,
+                        "shift_distribution": args.shift_distribution}
+    results = run_benchmark(args.sizes, args.seeds, args.engines, instance_options,
+                            min_availability_ratio=args.min_availability_ratio, merge=args.merge,
+                            consecutive_ratio=args.consecutive_ratio, time_limit=args.time_limit,
+                            track_memory=not args.no_memory)
+    with open(args.output, 'w') as file:
+        json.dump({"version": version(), "instance_options": instance_options, "results": results}, file, indent=2)
+    print(f'Results written to "{args.output}"')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import os
+import zlib
+import threading
+import pickle
+import hashlib
+from collections import OrderedDict
+from merging import availability_codes
+
+'''
+    Content-addressed cache on disk for preprocessed models and solutions.
+
+    Entries are stored under the hash (key) of what they are computed from: the availability matrix,
+    the first 5 columns and the TA names of the dataframe, and the parameters of the run. Rerunning
+    generate_schedule (see *scheduler.py*) on the same dataframe with the same parameters therefore
+    finds the result of the previous run, while any change to the input gives a different key.
+
+    Every entry is a compressed pickle file. Reading an entry marks it as recently used, and when the
+    cache grows beyond max_bytes the least recently used entries are removed. Entries are pickled objects of
+    this code (e.g. ScheduleModel, see *model.py*), so every key includes CACHE_VERSION, which is increased
+    whenever these objects change, and an entry that can't be loaded is treated as missing.
+
+    MemoryCache keeps the entries in memory instead, for a process that runs many schedules (see *service.py*).
+'''
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2  # 256 MB
+# version of the cached objects, increase it when they change so that older entries are never read
+CACHE_VERSION = 3
+
+
+def dataframe_key(df, **parameters):
+    """
+    hash of the normalised content of the dataframe ('No' and missing values are the same), the parameters
+    and the version of the cache
+    """
+    availability = availability_codes(df, list(df.columns[5:]))
+    digest = hashlib.sha256()
+    digest.update(f'version {CACHE_VERSION}'.encode())
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(repr(df.iloc[:, :5].astype(str).values.tolist()).encode())
+    digest.update(availability.tobytes())
+    digest.update(repr(sorted(parameters.items())).encode())
+    return digest.hexdigest()
+
+
+def derived_key(key, **parameters):
+    """
+    key of an entry that is computed from the entry with key and the parameters
+    """
+    return hashlib.sha256((key + repr(sorted(parameters.items()))).encode()).hexdigest()
+
+
+class ScheduleCache:
+    """
+    cache of entries (any picklable object) on disk, with least recently used eviction
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl.z')
+
+    def get(self, key):
+        """
+        the entry with key, or None if it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.loads(zlib.decompress(file.read()))
+            os.utime(path)  # mark as recently used
+        except Exception:
+            # e.g. a damaged file, an entry of other code (AttributeError, ModuleNotFoundError, ...), or an entry
+            # that another run sharing the directory removed in the meantime (OSError)
+            return None
+        return value
+
+    def put(self, key, value):
+        """
+        store an entry, and remove the least recently used entries if the cache is too large
+        """
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        path = self._path(key)
+        # write to a temporary file first, so other runs never read half an entry
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl.z'):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class MemoryCache:
+    """
+    cache of entries in memory with the interface of ScheduleCache, with least recently used eviction.
+    Entries are stored pickled, so a run can't change the entry of another run. Safe to use from several threads
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> pickled entry, least recently used first
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        the entry with key, or None if it is not in the cache
+        """
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        """
+        store an entry, and remove the least recently used entries if the cache is too large
+        """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if key in self.entries:
+                self.n_bytes -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.n_bytes += len(data)
+            while self.n_bytes > self.max_bytes and len(self.entries) > 1:
+                _, forgotten = self.entries.popitem(last=False)
+                self.n_bytes -= len(forgotten)
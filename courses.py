@@ -0,0 +1,78 @@
+from search import BranchAndBound
+from backjump import ConflictDirectedSearch
+from lns import LargeNeighbourhoodSearch
+from preference import optimize_preference
+
+'''
+    Joint schedule of several courses that share their TAs.
+
+    The groups of all courses form one model (see combine_courses in *scheduler.py*): a TA has the shifts of
+    all courses together, and can't take groups of different courses at the same time. Searching this model
+    as a whole takes time that grows exponentially with the total number of groups, so it is decomposed by course:
+
+        1. the minimum cost flow engine (see *preference.py*) appoints a TA to the groups of all courses at
+           once, which divides the shifts of every TA over the courses (if it finds no schedule, the first
+           schedule of the search in *backjump.py* is used)
+        2. every course is solved again with the groups of all other courses fixed, so the search only runs
+           over the groups of one course: exactly with branch-and-bound (see *search.py*), or with large
+           neighbourhood search (see *lns.py*) for courses with more than MAX_EXACT_GROUPS groups
+        3. step 2 is repeated as long as it improves the schedule, at most max_rounds times
+        4. large neighbourhood search over the groups of all courses, which can move shifts of a TA
+           from one course to another
+
+    A step only changes the schedule if it makes the joint schedule better (first more consecutive shifts,
+    then less 'Preferably Not'), and the time grows with the sum of the courses instead of their product.
+'''
+
+MAX_EXACT_GROUPS = 16
+
+
+def joint_assignment(model, course_groups, max_rounds=3, lns_time_limit=10.0, deadline=None):
+    """
+    schedule of the combined model of several courses. course_groups: list of the group indices of every course.
+    lns_time_limit: seconds of large neighbourhood search for a large course, and for all courses at the end.
+    Returns the TA index per group and the score (consecutive_count, preferably_not_count), or (None, None)
+    if no schedule is found
+    deadline: Deadline (see *deadline.py*), when it has passed the best schedule so far is returned
+    """
+    # only the start of the search, so a few rounds of the relaxation are enough
+    initial = optimize_preference(model, iterations=10, deadline=deadline)[0]
+    if initial is None:
+        initial = ConflictDirectedSearch(model, deadline=deadline).first_solution()
+    if initial is None:
+        return None, None
+    current = model.to_indices(initial).tolist()
+    score = (model.consecutive_count(current), model.preferably_not_count(current))
+
+    for _ in range(max_rounds):
+        improved = False
+        for groups in course_groups:
+            if deadline is not None and deadline.expired():
+                return current, score
+            if len(groups) <= MAX_EXACT_GROUPS:
+                course = set(groups)
+                fixed = {group: person for group, person in enumerate(current) if group not in course}
+                search = BranchAndBound(model.fix(fixed), deadline=deadline)
+                solution = search.solve(incumbent_score=score)
+                candidate_score = search.score()
+            else:
+                time_limit = lns_time_limit
+                if deadline is not None:
+                    time_limit = min(time_limit, deadline.remaining(default=time_limit))
+                solution, candidate_score = LargeNeighbourhoodSearch(model, groups=groups).solve(
+                    model.to_names(current), time_limit=time_limit, deadline=deadline)
+            if solution is not None and (candidate_score[0], -candidate_score[1]) > (score[0], -score[1]):
+                current = model.to_indices(solution).tolist()
+                score = candidate_score
+                improved = True
+        if not improved:
+            break
+
+    if deadline is None or not deadline.expired():
+        time_limit = lns_time_limit
+        if deadline is not None:
+            time_limit = min(time_limit, deadline.remaining(default=time_limit))
+        solution, score = LargeNeighbourhoodSearch(model).solve(model.to_names(current), time_limit=time_limit,
+                                                                deadline=deadline)
+        current = model.to_indices(solution).tolist()
+    return current, score
@@ -0,0 +1,96 @@
+import time
+import signal
+import threading
+import contextlib
+
+'''
+    Time budget for the search, so that every engine can be stopped at any time (anytime search).
+
+    A Deadline ends after time_limit seconds, at an absolute time (time.time()), or when the user presses
+    Ctrl+C while interrupts are caught. The engines check it while searching, and when it has passed they stop
+    and return the best schedule found so far. Whether the search was stopped is recorded in the deadline,
+    so the caller knows that the schedule is not proven to be the best one.
+'''
+
+
+class SearchStopped(Exception):
+    """
+    raised inside a search when its deadline has passed, and caught by the engine that runs the search
+    """
+
+
+class Deadline:
+    """
+    end of the time for the search: after time_limit seconds, at deadline (time.time()), whichever comes
+    first, or never if both are None
+    """
+    def __init__(self, time_limit=None, deadline=None):
+        ends = [end for end in (deadline, None if time_limit is None else time.time() + time_limit)
+                if end is not None]
+        self.end = min(ends) if ends else None
+        self.interrupted = False
+        self.stopped = False
+        self._checks = 0
+
+    def expired(self):
+        """
+        whether the time is up or the search is interrupted
+        """
+        return self.interrupted or (self.end is not None and time.time() >= self.end)
+
+    def remaining(self, default=None):
+        """
+        seconds until the end (0 if interrupted), or default if there is no end
+        """
+        if self.interrupted:
+            return 0.0
+        if self.end is None:
+            return default
+        return max(self.end - time.time(), 0.0)
+
+    def share(self, seconds=None, fraction=0.1):
+        """
+        seconds for a step before the search, e.g. preprocessing: at most seconds (None: no maximum) and at most
+        fraction of the remaining time, or None if both are unlimited
+        """
+        remaining = self.remaining()
+        limits = [limit for limit in (seconds, None if remaining is None else fraction * remaining) if limit is not None]
+        return min(limits) if limits else None
+
+    def check(self):
+        """
+        raise SearchStopped if the time is up. Only looks at the clock every 256 checks,
+        so it can be called for every node of a search
+        """
+        self._checks += 1
+        if self.interrupted or (self._checks & 255 == 0 and self.expired()):
+            self.stop()
+
+    def cancel(self):
+        """
+        end the time now, as Ctrl+C does (e.g. from another thread than the one that searches)
+        """
+        self.interrupted = True
+
+    def stop(self):
+        self.stopped = True
+        raise SearchStopped()
+
+    @contextlib.contextmanager
+    def catch_interrupt(self):
+        """
+        while in this context, Ctrl+C (SIGINT) ends the deadline instead of raising KeyboardInterrupt
+        """
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        def interrupt(signum, frame):
+            print("Interrupted, returning the best schedule found so far")
+            self.interrupted = True
+
+        previous = signal.signal(signal.SIGINT, interrupt)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGINT, previous)
@@ -0,0 +1,206 @@
+import math
+import time
+import random
+from search import BranchAndBound
+from deadline import Deadline, SearchStopped
+
+'''
+    Estimate of the time the search takes, before searching, to choose how to search.
+
+    The product of the domain sizes (after filtering, see *feasibility.py*) is the number of combinations of
+    TAs, but the search (see *search.py*) skips most of them: forward checking removes TAs that can't be
+    combined anymore, and branch-and-bound skips partial schedules that can't beat the best schedule so far.
+    The estimate therefore looks at the search itself:
+
+        1. the search runs for a short time. This finds a good schedule (the incumbent) and measures the
+           time per node and the time to the first schedule; small instances are simply solved completely
+        2. random probes (Knuth, 1975) estimate the size of the rest of the search tree: a probe walks from
+           the root to a leaf, at every node choosing one of the d TAs that the search would try (that pass
+           forward checking) at random, and stops at a dead end or where the bounds skip the subtree with
+           the incumbent. If the nodes on the way had d1, d2, ... children, the tree has about
+           1 + d1 + d1 * d2 + ... nodes, and the average over the probes is an unbiased estimate
+
+    The bounds get tighter when the search finds better schedules, so the estimate is an upper bound, but
+    the estimate of very unbalanced trees tends to be low. The fraction of the probes that end in a dead end
+    shows how tight the instance is. The 'csp' engine enumerates all schedules without the bounds, which can take
+    far longer, so its tree is estimated separately with probes without the incumbent.
+'''
+
+# seconds the estimate may take, half of it for the short search
+ESTIMATE_TIME = 1.0
+# maximum number of random probes
+ESTIMATE_PROBES = 256
+# seconds the search may take when no time limit is given
+DEFAULT_TIME_BUDGET = 600.0
+# fraction of the probes that end in a dead end above which an instance is tight (see choose_strategy)
+TIGHT_DEAD_ENDS = 0.9
+
+
+class SearchEstimator(BranchAndBound):
+    """
+    short search and random probes of the search tree of BranchAndBound (see *search.py*)
+    """
+    def estimate(self, time_limit=ESTIMATE_TIME, n_probes=ESTIMATE_PROBES, seed=0):
+        """
+        dictionary with the estimated size of the search tree (nodes), the fraction of dead ends, the seconds a
+        complete search and the search for the first schedule take, and the size and seconds of the enumeration
+        of all schedules without the bounds. complete: whether the short search already searched everything
+        (then the sizes and seconds of the search are measured)
+        """
+        log_domain_product = sum(math.log10(len(values)) for values in self.values.values() if values)
+        result = {"log10_domain_product": round(log_domain_product, 2), "complete": True, "nodes": 1,
+                  "probes": 0, "dead_ends": 1.0, "seconds_per_node": 0.0, "exhaustive_seconds": 0.0,
+                  "first_seconds": 0.0,
+                  "enumeration_nodes": 1, "enumeration_seconds": 0.0}
+        if not self._reset():
+            return result  # no schedule at all, found without searching
+
+        # 1. short search
+        self.deadline = Deadline(time_limit=time_limit / 2)
+        self.first_time = None
+        start = time.perf_counter()
+        try:
+            self._search(0)
+        except SearchStopped:
+            pass
+        elapsed = time.perf_counter() - start
+        complete = not self.deadline.stopped
+        nodes = self.nodes
+        seconds_per_node = elapsed / max(nodes, 1)
+        first_seconds = self.first_time - start if self.first_time is not None else None
+
+        if complete:
+            result["dead_ends"] = 0.0
+
+        # 2. random probes below the incumbent
+        self.deadline = None
+        rng = random.Random(seed)
+        if not complete:
+            self._reset(self.best_score)
+            mean_nodes, mean_solutions, dead_ends, n = self._probes(rng, n_probes, time_limit / 4)
+            searched = nodes
+            nodes = max(mean_nodes, searched)
+            if first_seconds is None:
+                # no schedule yet: the nodes per schedule, but not more than the whole tree
+                first_nodes = nodes if mean_solutions < 1 else min(nodes, max(nodes / mean_solutions, searched))
+                first_seconds = first_nodes * seconds_per_node
+            result.update(complete=False, probes=n, dead_ends=dead_ends)
+        elif first_seconds is None:
+            first_seconds = elapsed
+        result.update(nodes=round(nodes), seconds_per_node=seconds_per_node,
+                      exhaustive_seconds=elapsed if complete else nodes * seconds_per_node,
+                      first_seconds=first_seconds)
+
+        # 3. random probes without the incumbent: the tree of the enumeration of all schedules (the 'csp' engine),
+        # which is never smaller than the tree with the bounds. python-constraint takes about as long per node
+        self._reset()
+        enumeration_nodes = max(self._probes(rng, n_probes, time_limit / 4)[0], nodes)
+        result.update(enumeration_nodes=round(enumeration_nodes),
+                      enumeration_seconds=enumeration_nodes * seconds_per_node)
+        return result
+
+    def _probes(self, rng, n_probes, time_limit):
+        """
+        at most n_probes random probes (at least 1) for at most time_limit seconds, returns the mean of the
+        estimated numbers of nodes and schedules of the tree, the fraction of dead ends and the number of probes
+        """
+        probe_nodes = []
+        probe_solutions = []
+        dead_ends = 0
+        start = time.perf_counter()
+        while len(probe_nodes) < n_probes and (not probe_nodes or time.perf_counter() - start < time_limit):
+            n_nodes, n_solutions, dead_end = self._probe(rng)
+            probe_nodes.append(n_nodes)
+            probe_solutions.append(n_solutions)
+            dead_ends += dead_end
+        n = len(probe_nodes)
+        return sum(probe_nodes) / n, sum(probe_solutions) / n, dead_ends / n, n
+
+    def _record(self):
+        if self.first_time is None:
+            self.first_time = time.perf_counter()
+        super()._record()
+
+    def _probe(self, rng):
+        """
+        walk a random path from the root, returns the estimated number of nodes and schedules of the tree,
+        and whether the path ended in a dead end
+        """
+        nodes = 1.0
+        weight = 1.0
+        path = []
+        dead_end = False
+        while len(path) < len(self.order) and self._can_improve():
+            group = self._select_group()
+            # the TAs that pass forward checking are the children the search visits
+            children = []
+            for person in self._order_values(group):
+                trail = []
+                if self._assign(group, person, trail):
+                    children.append(person)
+                self._unassign(group, person, trail)
+            if not children:
+                dead_end = True
+                break
+            weight *= len(children)
+            nodes += weight
+            person = rng.choice(children)
+            trail = []
+            self._assign(group, person, trail)
+            path.append((group, person, trail))
+        complete = len(path) == len(self.order)
+        for group, person, trail in reversed(path):
+            self._unassign(group, person, trail)
+        return nodes, weight if complete else 0.0, dead_end
+
+
+def estimate_search(model, time_limit=ESTIMATE_TIME, n_probes=ESTIMATE_PROBES, seed=0):
+    """
+    estimate of the search of the model (see SearchEstimator.estimate)
+    """
+    return SearchEstimator(model).estimate(time_limit, n_probes, seed)
+
+
+def choose_strategy(estimate, budget=DEFAULT_TIME_BUDGET, engine='auto'):
+    """
+    engine and whether to search all schedules, expected to finish within budget seconds.
+    engine 'auto': a complete search ('bnb', or 'cbj' on tight instances) if it fits, otherwise the first schedule
+    of that search, and otherwise large neighbourhood search ('lns'), which takes any amount of time.
+    For another engine only whether it searches all schedules: 'bnb' and 'cbj' if the complete search fits, 'csp'
+    if the enumeration of all schedules without the bounds fits, and never 'flow' and 'lns'
+    """
+    if engine in ('flow', 'lns'):
+        return engine, False
+    if engine == 'csp':
+        return engine, estimate["enumeration_seconds"] <= budget
+    if engine != 'auto':
+        return engine, estimate["exhaustive_seconds"] <= budget
+    engine = 'cbj' if estimate["dead_ends"] > TIGHT_DEAD_ENDS else 'bnb'
+    if estimate["exhaustive_seconds"] <= budget:
+        return engine, True
+    if estimate["first_seconds"] <= budget:
+        return engine, False
+    return 'lns', False
+
+
+def format_estimate(estimate):
+    """
+    short description of an estimate for the user
+    """
+    description = (f"Search space: 10^{estimate['log10_domain_product']:.1f} combinations of TAs, search tree of "
+                   f"about 10^{math.log10(max(estimate['nodes'], 1)):.1f} nodes")
+    if not estimate["complete"]:
+        description += f" ({estimate['dead_ends'] * 100:.0f}% dead ends)"
+    return (f"{description}, predicted {format_seconds(estimate['exhaustive_seconds'])} to search all schedules "
+            f"({format_seconds(estimate['enumeration_seconds'])} to enumerate them with the 'csp' engine) "
+            f"and {format_seconds(estimate['first_seconds'])} to the first schedule")
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} seconds"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} minutes"
+    if seconds < 86400 * 365:
+        return f"{seconds / 3600:.1f} hours"
+    return "more than a year"
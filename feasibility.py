@@ -0,0 +1,95 @@
+from flow import MaxFlow, MinCostFlow
+from model import NO
+
+'''
+    Feasibility check and domain filtering with a capacitated matching between groups and TAs.
+
+    Every group needs exactly one TA, every TA gets exactly their number of shifts, and a TA can take
+    at most one of the groups that take place at the same time. This is a flow network:
+
+        source -> TA (number of shifts) -> TA at a time slot (1) -> group (1) -> sink (1)
+
+    (a pooled TA, see *symmetry.py*, can take as many groups at a time slot as the TAs it stands for)
+
+    If the maximum flow is smaller than the number of groups, there is no schedule at all. Otherwise,
+    a (group, TA) value can only be part of a schedule if it carries flow in some maximum flow, which is
+    the case if it carries flow now or if the group and the TA are in the same strongly connected component
+    of the residual network. All other values are removed from the domains before the search starts, which
+    never removes a solution.
+'''
+
+
+def capacity_network(model, costs=None):
+    """
+    build the flow network of the model, returns the network, the source and sink node and a dictionary
+    of (group, TA) -> edge index.
+    costs: dictionary of (group, TA) -> cost. If given, a minimum cost flow network is built
+    with only the (group, TA) combinations in costs
+    """
+    if costs is None:
+        values = [(group, person) for group in range(model.n_groups) for person in model.domain(group)]
+    else:
+        values = list(costs)
+
+    n_groups, n_persons = model.n_groups, model.n_persons
+    slots = model.slots
+
+    source = 0
+    sink = 1
+    person_node = {person: 2 + person for person in range(n_persons)}
+    group_node = {group: 2 + n_persons + group for group in range(n_groups)}
+    slot_node = {}
+    for group, person in values:
+        key = (person, slots[group])
+        if key not in slot_node:
+            slot_node[key] = 2 + n_persons + n_groups + len(slot_node)
+
+    n_nodes = 2 + n_persons + n_groups + len(slot_node)
+    network = MaxFlow(n_nodes) if costs is None else MinCostFlow(n_nodes)
+
+    def add_edge(u, v, capacity, cost=0):
+        if costs is None:
+            return network.add_edge(u, v, capacity)
+        return network.add_edge(u, v, capacity, cost)
+
+    for person in range(n_persons):
+        add_edge(source, person_node[person], int(model.n_shifts[person]))
+    for (person, slot), node in slot_node.items():
+        # a pooled TA stands for several TAs, who can each take a group in the time slot
+        add_edge(person_node[person], node, int(model.pool_size[person]))
+    edges = {}
+    for group, person in values:
+        cost = 0 if costs is None else costs[group, person]
+        edges[group, person] = add_edge(slot_node[person, slots[group]], group_node[group], 1, cost)
+    for group in range(n_groups):
+        add_edge(group_node[group], sink, 1)
+    return network, source, sink, edges
+
+
+def filter_domains(model):
+    """
+    check whether every group can be appointed to an available TA without exceeding the number of shifts,
+    and remove every (group, TA) value that can't be part of such a schedule.
+    Returns the filtered model and the number of removed values, or (None, 0) if there is no schedule at all
+    """
+    network, source, sink, edges = capacity_network(model)
+    if network.solve(source, sink) < model.n_groups:
+        return None, 0
+
+    component = network.residual_components()
+    removed = []
+    for (group, person), edge in edges.items():
+        u, v = network.to[edge ^ 1], network.to[edge]
+        if network.flow(edge) == 0 and component[u] != component[v]:
+            removed.append((group, person))
+
+    if not removed:
+        return model, 0
+    return model.remove(removed), len(removed)
+
+
+def count_values(model):
+    """
+    total number of (group, TA) values over all domains
+    """
+    return int((model.availability != NO).sum())
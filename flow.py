@@ -0,0 +1,252 @@
+import heapq
+from collections import deque
+
+'''
+    Graph algorithms for flow networks, used to reason about shift capacities.
+
+    Nodes are integers (0..n_nodes-1), and edges are stored in flat lists so that the
+    residual capacity of an edge and its reverse edge can be updated in place.
+'''
+
+
+class MaxFlow:
+    """
+    maximum flow with Dinic's algorithm
+    """
+    def __init__(self, n_nodes):
+        self.n_nodes = n_nodes
+        self.adjacency = [[] for _ in range(n_nodes)]
+        self.to = []
+        self.capacity = []
+
+    def add_edge(self, u, v, capacity):
+        """
+        add an edge from u to v, returns the index of the edge
+        """
+        index = len(self.to)
+        self.adjacency[u].append(index)
+        self.to.append(v)
+        self.capacity.append(capacity)
+        # reverse edge (index ^ 1) with no capacity of its own
+        self.adjacency[v].append(index + 1)
+        self.to.append(u)
+        self.capacity.append(0)
+        return index
+
+    def flow(self, edge):
+        """
+        flow over an edge, equal to the residual capacity of its reverse edge
+        """
+        return self.capacity[edge ^ 1]
+
+    def solve(self, source, sink):
+        """
+        compute the maximum flow from source to sink, returns the value of the flow
+        """
+        total = 0
+        while True:
+            level = self._levels(source)
+            if level[sink] < 0:
+                return total
+            pointer = [0] * self.n_nodes
+            while True:
+                pushed = self._push(source, sink, level, pointer)
+                if not pushed:
+                    break
+                total += pushed
+
+    def _levels(self, source):
+        level = [-1] * self.n_nodes
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for edge in self.adjacency[u]:
+                v = self.to[edge]
+                if self.capacity[edge] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    def _push(self, source, sink, level, pointer):
+        """
+        find one augmenting path in the level graph (iteratively), returns the flow pushed over it
+        """
+        path = []
+        u = source
+        while u != sink:
+            adjacency = self.adjacency[u]
+            while pointer[u] < len(adjacency):
+                edge = adjacency[pointer[u]]
+                v = self.to[edge]
+                if self.capacity[edge] > 0 and level[v] == level[u] + 1:
+                    break
+                pointer[u] += 1
+            else:
+                # dead end, go back one step
+                if not path:
+                    return 0
+                level[u] = -1
+                edge = path.pop()
+                u = self.to[edge ^ 1]
+                pointer[u] += 1
+                continue
+            path.append(edge)
+            u = self.to[edge]
+
+        pushed = min(self.capacity[edge] for edge in path)
+        for edge in path:
+            self.capacity[edge] -= pushed
+            self.capacity[edge ^ 1] += pushed
+        return pushed
+
+    def residual_components(self):
+        """
+        strongly connected components of the residual graph, returns the component of every node
+        """
+        residual = [[self.to[edge] for edge in self.adjacency[u] if self.capacity[edge] > 0]
+                    for u in range(self.n_nodes)]
+        return strongly_connected_components(residual)
+
+
+class MinCostFlow:
+    """
+    minimum cost flow with successive shortest paths (Dijkstra with node potentials).
+    All edge costs must be non-negative
+    """
+    def __init__(self, n_nodes):
+        self.n_nodes = n_nodes
+        self.adjacency = [[] for _ in range(n_nodes)]
+        self.to = []
+        self.capacity = []
+        self.cost = []
+
+    def add_edge(self, u, v, capacity, cost):
+        """
+        add an edge from u to v, returns the index of the edge
+        """
+        index = len(self.to)
+        self.adjacency[u].append(index)
+        self.to.append(v)
+        self.capacity.append(capacity)
+        self.cost.append(cost)
+        # reverse edge (index ^ 1) with no capacity of its own and negative cost
+        self.adjacency[v].append(index + 1)
+        self.to.append(u)
+        self.capacity.append(0)
+        self.cost.append(-cost)
+        return index
+
+    def flow(self, edge):
+        """
+        flow over an edge, equal to the residual capacity of its reverse edge
+        """
+        return self.capacity[edge ^ 1]
+
+    def solve(self, source, sink, max_flow=float('inf')):
+        """
+        send as much flow as possible (up to max_flow) from source to sink at minimum cost,
+        returns the value and the cost of the flow
+        """
+        potential = [0.0] * self.n_nodes
+        total_flow = 0
+        total_cost = 0.0
+        while total_flow < max_flow:
+            distance, parent_edge = self._shortest_paths(source, potential)
+            if distance[sink] == float('inf'):
+                break
+            for node in range(self.n_nodes):
+                if distance[node] < float('inf'):
+                    potential[node] += distance[node]
+
+            # bottleneck capacity along the shortest path
+            pushed = max_flow - total_flow
+            node = sink
+            while node != source:
+                edge = parent_edge[node]
+                pushed = min(pushed, self.capacity[edge])
+                node = self.to[edge ^ 1]
+            node = sink
+            while node != source:
+                edge = parent_edge[node]
+                self.capacity[edge] -= pushed
+                self.capacity[edge ^ 1] += pushed
+                total_cost += pushed * self.cost[edge]
+                node = self.to[edge ^ 1]
+            total_flow += pushed
+        return total_flow, total_cost
+
+    def _shortest_paths(self, source, potential):
+        """
+        Dijkstra on the residual graph with reduced costs
+        """
+        distance = [float('inf')] * self.n_nodes
+        parent_edge = [-1] * self.n_nodes
+        distance[source] = 0.0
+        queue = [(0.0, source)]
+        while queue:
+            dist, u = heapq.heappop(queue)
+            if dist > distance[u]:
+                continue
+            for edge in self.adjacency[u]:
+                if self.capacity[edge] <= 0:
+                    continue
+                v = self.to[edge]
+                # reduced costs are non-negative, up to rounding errors
+                reduced_cost = max(0.0, self.cost[edge] + potential[u] - potential[v])
+                if dist + reduced_cost < distance[v]:
+                    distance[v] = dist + reduced_cost
+                    parent_edge[v] = edge
+                    heapq.heappush(queue, (distance[v], v))
+        return distance, parent_edge
+
+
+def strongly_connected_components(adjacency):
+    """
+    strongly connected components with (iterative) Tarjan's algorithm,
+    returns the component number of every node
+    """
+    n_nodes = len(adjacency)
+    index = [-1] * n_nodes
+    lowlink = [0] * n_nodes
+    on_stack = [False] * n_nodes
+    component = [-1] * n_nodes
+    stack = []
+    counter = 0
+    n_components = 0
+
+    for root in range(n_nodes):
+        if index[root] >= 0:
+            continue
+        work = [(root, 0)]
+        while work:
+            u, i = work.pop()
+            if i == 0:
+                index[u] = lowlink[u] = counter
+                counter += 1
+                stack.append(u)
+                on_stack[u] = True
+            recurse = False
+            for j in range(i, len(adjacency[u])):
+                v = adjacency[u][j]
+                if index[v] < 0:
+                    work.append((u, j + 1))
+                    work.append((v, 0))
+                    recurse = True
+                    break
+                if on_stack[v]:
+                    lowlink[u] = min(lowlink[u], index[v])
+            if recurse:
+                continue
+            if lowlink[u] == index[u]:
+                while True:
+                    v = stack.pop()
+                    on_stack[v] = False
+                    component[v] = n_components
+                    if v == u:
+                        break
+                n_components += 1
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[u])
+    return component
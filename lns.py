@@ -0,0 +1,135 @@
+import time
+import random
+from collections import defaultdict
+from model import PREFERABLY_NOT
+from search import BranchAndBound
+
+'''
+    Large neighbourhood search (LNS) for schedules with many groups.
+
+    Starting from any schedule, a few groups are freed (a neighbourhood) while all other groups keep their TA.
+    The freed groups are then solved exactly with branch-and-bound (see *search.py*), which only accepts a
+    schedule that is better than the current one: first more consecutive shifts, then less 'Preferably Not'.
+    This is repeated until the time limit is reached, so the search can be stopped at any time with the
+    best schedule so far. When no improvement is found for a while, the neighbourhoods grow.
+'''
+
+
+class LargeNeighbourhoodSearch:
+    """
+    large neighbourhood search over the groups (variables) and TAs (values) of a ScheduleModel
+    """
+    def __init__(self, model, neighbourhood_size=8, max_neighbourhood_size=14, seed=0, groups=None):
+        """
+        groups: indices of the groups that may get another TA (default: all groups), the others keep their TA
+        """
+        self.model = model
+        self.groups = list(range(model.n_groups)) if groups is None else sorted(groups)
+        self.allowed = set(self.groups)
+        self.neighbourhood_size = neighbourhood_size
+        self.max_neighbourhood_size = max_neighbourhood_size
+        self.random = random.Random(seed)
+
+        self.partners = defaultdict(list)
+        for group1, group2 in model.consecutive:
+            self.partners[group1].append(group2)
+            self.partners[group2].append(group1)
+        self.same_slot = defaultdict(list)
+        for group, slot in enumerate(model.slots):
+            self.same_slot[slot].append(group)
+
+    def solve(self, initial, time_limit=60.0, max_iterations=None, deadline=None):
+        """
+        improve the initial schedule (dictionary of group name -> TA name) until time_limit (seconds) or
+        max_iterations is reached, or deadline (see *deadline.py*) has passed. Returns the best schedule
+        and its score (consecutive_shift_count, preferably_not_count)
+        """
+        model = self.model
+        current = model.to_indices(initial).tolist()
+        score = (model.consecutive_count(current), model.preferably_not_count(current))
+        self.iterations = 0
+        self.improvements = 0
+
+        size = min(self.neighbourhood_size, len(self.groups))
+        stalled = 0
+        end = time.time() + time_limit
+        while time.time() < end and (max_iterations is None or self.iterations < max_iterations):
+            if deadline is not None and deadline.expired():
+                break
+            self.iterations += 1
+            freed = self._neighbourhood(current, size)
+            fixed = {group: current[group] for group in range(model.n_groups) if group not in freed}
+
+            candidate = BranchAndBound(model.fix(fixed), deadline=deadline).solve(incumbent_score=score)
+            if candidate is None:
+                stalled += 1
+                if stalled >= 2 * len(self.groups) and size < min(self.max_neighbourhood_size, len(self.groups)):
+                    size += 1
+                    stalled = 0
+                continue
+
+            candidate = model.to_indices(candidate).tolist()
+            consecutive_delta, preferably_not_delta = self._delta(current, candidate, freed)
+            score = (score[0] + consecutive_delta, score[1] + preferably_not_delta)
+            current = candidate
+            self.improvements += 1
+            stalled = 0
+        return model.to_names(current), score
+
+    def _neighbourhood(self, current, size):
+        """
+        pick the groups to free: random groups, all groups of a few TAs, or groups related to a random group
+        (consecutive groups, groups at the same time and the other groups of their TAs)
+        """
+        model = self.model
+        kind = self.random.randrange(3)
+        if kind == 0:
+            return set(self.random.sample(self.groups, size))
+
+        freed = set()
+        if kind == 1:
+            persons = list(set(current))
+            self.random.shuffle(persons)
+            for person in persons:
+                freed.update(group for group in self.groups if current[group] == person)
+                if len(freed) >= size:
+                    break
+        else:
+            queue = [self.random.choice(self.groups)]
+            while queue and len(freed) < size:
+                group = queue.pop(0)
+                if group in freed:
+                    continue
+                freed.add(group)
+                related = self.partners[group] + self.same_slot[model.slots[group]]
+                related += [other for other in self.groups if current[other] == current[group]]
+                self.random.shuffle(related)
+                queue.extend(related)
+
+        # top up with random groups, and never free more than size groups
+        freed = [group for group in freed if group in self.allowed]
+        self.random.shuffle(freed)
+        freed = set(freed[:size])
+        others = [group for group in self.groups if group not in freed]
+        freed.update(self.random.sample(others, min(size - len(freed), len(others))))
+        return freed
+
+    def _delta(self, current, candidate, freed):
+        """
+        change in (consecutive_shift_count, preferably_not_count), only looking at the freed groups
+        """
+        availability = self.model.availability
+        consecutive_delta = 0
+        preferably_not_delta = 0
+        pairs = set()
+        for group in freed:
+            preferably_not_delta += int(availability[group, candidate[group]] == PREFERABLY_NOT)
+            preferably_not_delta -= int(availability[group, current[group]] == PREFERABLY_NOT)
+            pairs.update((min(group, other), max(group, other)) for other in self.partners[group])
+        for group1, group2 in pairs:
+            consecutive_delta += self._same_person(candidate, group1, group2) - self._same_person(current, group1, group2)
+        return consecutive_delta, preferably_not_delta
+
+    def _same_person(self, assignment, group1, group2):
+        person = assignment[group1]
+        return int(person == assignment[group2] and not self.model.is_pooled(person))
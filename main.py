@@ -1,5 +1,6 @@
 # import functions to create schedule, and import other packages
 from scheduler import *
+from workbooks import read_availability
 
 '''
     These scripts can be used or adapted to create a schedule for the Statistics Practicals for the
@@ -11,11 +12,13 @@ from scheduler import *
     
 '''
 
-# define where Excel file can be found
-path_excelfile = "examples\\example_dataframe_long.xlsx" # make sure to use '\\'
+# define where Excel file can be found (or a .csv, .parquet or .arrow file with the same columns)
+path_excelfile = os.path.join("examples", "example_dataframe_long.xlsx")
 
-# read file
-df = pd.read_excel(path_excelfile)
+# read file, a parsed workbook is kept in a snapshot next to it (see *workbooks.py*)
+df = read_availability(path_excelfile)
 
-# generate schedule
+# generate schedule, min_availability_ratio allows decreasing 'Preferably Not' if the search would take too long
 df = generate_schedule(dataframe=df, min_availability_ratio = 0.3)
+
+# to schedule many workbooks at once without questions, see *batch.py*, e.g. python batch.py availability/
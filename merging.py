@@ -0,0 +1,141 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+from model import AVAILABILITY_CODES, NO, YES
+
+'''
+    Automatic (non-interactive) merging of TAs with similar availability.
+
+    The similarity of two TAs is the fraction of groups for which both are available or both are not
+    ('Yes' and 'Preferably Not' count as available), as in calculate_similarity_scores in *scheduler.py*.
+    All similarities are computed at once with matrix products on the availability matrix (groups x TAs),
+    and after a merge only the row and column of the merged TA are computed again.
+
+    Merge policy, repeated until there are required_columns TAs left:
+        1. only pairs whose merged availability has at least one 'Yes' and at least as many available groups
+           as their combined number of shifts are considered
+        2. pairs of TAs that are not merged yet go before pairs with an already merged TA
+        3. the most similar pair is merged, ties are broken by the most shared 'Yes', then by column order
+'''
+
+# answer for every availability code
+ANSWERS = np.array(sorted(AVAILABILITY_CODES, key=AVAILABILITY_CODES.get), dtype=object)
+
+
+def availability_codes(df, columns):
+    """
+    availability matrix (groups x TAs) of the columns, 'No' and missing values are NO
+    """
+    values = df[columns].to_numpy(dtype=object)
+    codes = np.full(values.shape, NO, dtype=np.int8)
+    for answer, code in AVAILABILITY_CODES.items():
+        codes[values == answer] = code
+    return codes
+
+
+def similarity_matrix(codes):
+    """
+    similarity (fraction of matching available/not available groups) between all pairs of TAs
+    """
+    available = (codes != NO).astype(np.int64)
+    matches = available.T @ available + (1 - available).T @ (1 - available)
+    return matches / codes.shape[0]
+
+
+def combined_codes(codes1, codes2):
+    """
+    availability of two merged TAs: 'No' if one is not available, else 'Preferably Not' if one
+    prefers not, else 'Yes' (same as combine_availability in *scheduler.py*)
+    """
+    return np.minimum(codes1, codes2)
+
+
+def auto_merge_employee_availability(df, required_columns):
+    """
+    merge TAs with the merge policy above until there are required_columns TAs left.
+    Returns the merged dataframe and the audit log (list of dictionaries, one per merge)
+    """
+    columns = list(df.columns[5:])
+    codes = availability_codes(df, columns)
+    names, n_shifts = [], []
+    for column in columns:
+        name, shifts = column.split('_')
+        names.append(name)
+        n_shifts.append(int(shifts))
+    merged = ['-' in column for column in columns]
+
+    # pairwise statistics, updated incrementally after every merge
+    available = (codes != NO).astype(np.int64)
+    yes = (codes == YES).astype(np.int64)
+    similarity = similarity_matrix(codes)
+    shared_available = available.T @ available
+    shared_yes = yes.T @ yes
+
+    audit_log = []
+    while len(columns) > required_columns:
+        n = len(columns)
+        shifts = np.asarray(n_shifts)
+        allowed = (shared_yes > 0) & (shared_available >= shifts[:, None] + shifts[None, :])
+        allowed &= np.triu(np.ones((n, n), dtype=bool), k=1)
+        fresh = ~np.asarray(merged)
+        candidates = allowed & fresh[:, None] & fresh[None, :]
+        if not candidates.any():
+            candidates = allowed
+        if not candidates.any():
+            sys.exit(f"TAs can't be merged automatically to {required_columns} columns without losing all 'Yes' "
+                     f"availability or too many available groups, merge them by hand or raise required_columns")
+
+        # best pair: highest similarity, then most shared 'Yes', then first in column order
+        i, j = np.nonzero(candidates)
+        best = np.lexsort((j, i, -shared_yes[i, j], -similarity[i, j]))[0]
+        i, j = int(i[best]), int(j[best])
+
+        column = f'{names[i]}-{names[j]}_{n_shifts[i] + n_shifts[j]}'
+        new_codes = combined_codes(codes[:, i], codes[:, j])
+        audit_log.append({"Merge": len(audit_log) + 1, "TA 1": columns[i], "TA 2": columns[j],
+                          "Merged TA": column, "Similarity": float(similarity[i, j]),
+                          "Shared Yes": int(shared_yes[i, j]), "Available groups": int(shared_available[i, j])})
+        print(f"Merged {columns[i]} and {columns[j]} into {column} (Similarity: {similarity[i, j] * 100:.2f}%)")
+        df[column] = ANSWERS[new_codes]
+        df = df.drop([columns[i], columns[j]], axis=1)
+
+        # drop both TAs and add the merged TA at the end, like in the dataframe
+        keep = [k for k in range(n) if k not in (i, j)]
+        codes = np.column_stack([codes[:, keep], new_codes])
+        available = np.column_stack([available[:, keep], new_codes != NO]).astype(np.int64)
+        yes = np.column_stack([yes[:, keep], new_codes == YES]).astype(np.int64)
+        names = [names[k] for k in keep] + [f'{names[i]}-{names[j]}']
+        n_shifts = [n_shifts[k] for k in keep] + [n_shifts[i] + n_shifts[j]]
+        merged = [merged[k] for k in keep] + [True]
+        columns = [columns[k] for k in keep] + [column]
+
+        shared_available = _extend(shared_available[np.ix_(keep, keep)], available.T @ available[:, -1])
+        shared_yes = _extend(shared_yes[np.ix_(keep, keep)], yes.T @ yes[:, -1])
+        matches = shared_available[-1] + (1 - available).T @ (1 - available[:, -1])
+        similarity = _extend(similarity[np.ix_(keep, keep)], matches / codes.shape[0])
+    return df, audit_log
+
+
+def _extend(matrix, row):
+    """
+    add the row (and column) of the last TA to a symmetric matrix of pairs of TAs
+    """
+    n = matrix.shape[0]
+    extended = np.empty((n + 1, n + 1), dtype=np.result_type(matrix, row))
+    extended[:n, :n] = matrix
+    extended[n, :] = row
+    extended[:, n] = row
+    return extended
+
+
+def write_merge_log(audit_log, suffix):
+    """
+    write the audit log of the merges to output/merge_log_{suffix}.csv
+    """
+    output_path = os.path.join(os.getcwd(), 'output')
+    if not os.path.exists(output_path):
+        os.mkdir(output_path)
+    full_path = os.path.join(output_path, f'merge_log_{suffix}.csv')
+    pd.DataFrame(audit_log).to_csv(full_path, index=False)
+    print(f'Merge log written to "{full_path}"')
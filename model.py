@@ -0,0 +1,182 @@
+import copy
+import numpy as np
+
+'''
+    Compact, integer-indexed representation of a scheduling problem.
+
+    The model is built once per run (see create_schedule_model in *scheduler.py*) and shared by all
+    stages: setting up the CSP, searching and ranking solutions. Groups and TAs are mapped to integers,
+    availability is stored as an int8 matrix (groups x TAs) and pairs of groups are stored as sets,
+    so checking whether two groups are incompatible or consecutive doesn't require scanning a list.
+'''
+
+NO = 0
+PREFERABLY_NOT = 1
+YES = 2
+AVAILABILITY_CODES = {'No': NO, 'Preferably Not': PREFERABLY_NOT, 'Yes': YES}
+
+
+class ScheduleModel:
+    """
+    groups (variables) and TAs (values) of the schedule, with their availability and constraints
+    """
+    def __init__(self, groups, persons, n_shifts, availability, incompatible_combinations, consecutive_groups,
+                 slots=None, pool_size=None):
+        """
+        groups: list of group names
+        persons: list of TA names
+        n_shifts: number of shifts per TA
+        availability: matrix (groups x TAs) with NO, PREFERABLY_NOT or YES
+        incompatible_combinations: pairs of group names that can't be appointed to the same TA
+        consecutive_groups: pairs of group names that are consecutive (same room)
+        slots: time slot (integer) of every group, groups in the same time slot take place at the same time
+        pool_size: number of interchangeable TAs (with 1 shift each) that every TA stands for, see *symmetry.py*.
+        A pooled TA can take incompatible groups, and its groups are never consecutive for one person
+        """
+        self.groups = list(groups)
+        self.persons = list(persons)
+        self.group_index = {group: i for i, group in enumerate(self.groups)}
+        self.person_index = {person: i for i, person in enumerate(self.persons)}
+
+        self.n_shifts = np.asarray(n_shifts, dtype=np.int64)
+        if slots is None:
+            slots = range(len(self.groups))
+        self.slots = [int(slot) for slot in slots]
+        if pool_size is None:
+            pool_size = np.ones(len(self.persons))
+        self.pool_size = np.asarray(pool_size, dtype=np.int64)
+        self.availability = np.asarray(availability, dtype=np.int8)
+
+        self.incompatible = self._index_pairs(incompatible_combinations)
+        self.consecutive = self._index_pairs(consecutive_groups)
+
+        # bitmask per group of the groups it can't share a TA with
+        self.conflict_mask = [0] * self.n_groups
+        for i, j in self.incompatible:
+            self.conflict_mask[i] |= 1 << j
+            self.conflict_mask[j] |= 1 << i
+
+    def _index_pairs(self, pairs):
+        """
+        convert pairs of group names to a set of sorted pairs of group indices
+        """
+        index_pairs = set()
+        for group1, group2 in pairs:
+            i, j = self.group_index[group1], self.group_index[group2]
+            if i != j:
+                index_pairs.add((min(i, j), max(i, j)))
+        return index_pairs
+
+    @property
+    def n_groups(self):
+        return len(self.groups)
+
+    @property
+    def n_persons(self):
+        return len(self.persons)
+
+    @property
+    def n_plus1shift(self):
+        """
+        number of TAs with more than 1 shift
+        """
+        return int(((self.n_shifts > 1) & (self.pool_size == 1)).sum())
+
+    def domain(self, group):
+        """
+        indices of the TAs that are available for group (index)
+        """
+        return np.flatnonzero(self.availability[group] != NO).tolist()
+
+    def domains(self):
+        """
+        dictionary of group name -> list of available TA names
+        """
+        return {self.groups[g]: [self.persons[p] for p in self.domain(g)] for g in range(self.n_groups)}
+
+    def conflicts(self, group):
+        """
+        indices of the groups that can't be appointed to the same TA as group (index)
+        """
+        mask = self.conflict_mask[group]
+        return [other for other in range(self.n_groups) if mask >> other & 1]
+
+    def fix(self, assignments):
+        """
+        copy of the model in which the groups in assignments (dictionary of group index -> TA index)
+        can only be appointed to their assigned TA
+        """
+        model = copy.copy(self)
+        model.availability = self.availability.copy()
+        for group, person in assignments.items():
+            model.availability[group] = NO
+            model.availability[group, person] = self.availability[group, person]
+        return model
+
+    def remove(self, values):
+        """
+        copy of the model in which the (group index, TA index) combinations in values are not available
+        """
+        model = copy.copy(self)
+        model.availability = self.availability.copy()
+        for group, person in values:
+            model.availability[group, person] = NO
+        return model
+
+    def is_pooled(self, person):
+        """
+        whether the TA (index) stands for more than one interchangeable TA
+        """
+        return self.pool_size[person] > 1
+
+    def is_preferably_not(self, group, person):
+        return self.availability[group, person] == PREFERABLY_NOT
+
+    def incompatible_names(self):
+        return sorted((self.groups[i], self.groups[j]) for i, j in self.incompatible)
+
+    def consecutive_names(self):
+        return sorted((self.groups[i], self.groups[j]) for i, j in self.consecutive)
+
+    def to_indices(self, solution):
+        """
+        convert a solution (dictionary of group name -> TA name) to an array of TA indices per group
+        """
+        return np.array([self.person_index[solution[group]] for group in self.groups], dtype=np.int64)
+
+    def to_names(self, assignment):
+        """
+        convert an array of TA indices per group to a solution (dictionary of group name -> TA name)
+        """
+        return {self.groups[g]: self.persons[p] for g, p in enumerate(assignment)}
+
+    def consecutive_count(self, assignment):
+        """
+        number of consecutive groups appointed to the same TA
+        """
+        return int(sum(assignment[i] == assignment[j] and not self.is_pooled(assignment[i])
+                       for i, j in self.consecutive))
+
+    def preferably_not_count(self, assignment):
+        """
+        number of groups appointed to a TA that is 'Preferably Not' available
+        """
+        return int((self.availability[np.arange(self.n_groups), assignment] == PREFERABLY_NOT).sum())
+
+    def consecutive_counts(self, assignments):
+        """
+        consecutive_count of every row of a matrix (solutions x groups) of TA indices
+        """
+        assignments = np.asarray(assignments, dtype=np.int64)
+        if not self.consecutive:
+            return np.zeros(len(assignments), dtype=np.int64)
+        first, second = np.array(sorted(self.consecutive)).T
+        persons = assignments[:, first]
+        return ((persons == assignments[:, second]) & (self.pool_size[persons] == 1)).sum(axis=1)
+
+    def preferably_not_counts(self, assignments):
+        """
+        preferably_not_count of every row of a matrix (solutions x groups) of TA indices
+        """
+        assignments = np.asarray(assignments, dtype=np.int64)
+        return (self.availability[np.arange(self.n_groups), assignments] == PREFERABLY_NOT).sum(axis=1)
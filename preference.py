@@ -0,0 +1,142 @@
+import math
+from feasibility import capacity_network
+from model import PREFERABLY_NOT
+
+'''
+    Minimum cost flow engine that minimises the number of 'Preferably Not' in the schedule.
+
+    Without the inconvenient combinations (consecutive groups in different rooms), the best schedule for
+    'Preferably Not' is a minimum cost flow in the network of *feasibility.py*, where appointing a TA to a
+    group costs 1 if the TA is 'Preferably Not' available. Groups at the same time are already handled by
+    the network itself. The remaining inconvenient combinations are handled with Lagrangian relaxation:
+    appointing a TA to both groups of a combination is penalised, and the penalties are adjusted until the
+    flow respects all combinations, or a repair step forbids the TA for one of the groups.
+
+    The minimum cost of the relaxation is a lower bound on the number of 'Preferably Not' of any schedule,
+    so the engine reports how far the schedule it found can be from the best schedule.
+    Note that this engine does not look at consecutive shifts.
+'''
+
+
+def inconvenient_combinations(model):
+    """
+    incompatible combinations of groups that are not in the same time slot
+    """
+    return sorted((group1, group2) for group1, group2 in model.incompatible
+                  if model.slots[group1] != model.slots[group2])
+
+
+def min_cost_assignment(model, costs):
+    """
+    appoint a TA to every group at minimum cost, using only the (group, TA) combinations in costs.
+    Returns the TA index per group and the cost, or (None, None) if not every group can be appointed
+    """
+    network, source, sink, edges = capacity_network(model, costs)
+    flow, cost = network.solve(source, sink)
+    if flow < model.n_groups:
+        return None, None
+    assignment = [None] * model.n_groups
+    for (group, person), edge in edges.items():
+        if network.flow(edge):
+            assignment[group] = person
+    return assignment, cost
+
+
+def violations(model, assignment, combinations):
+    """
+    inconvenient combinations (with the TA) that are appointed to the same (not pooled) TA
+    """
+    return [(group1, group2, assignment[group1]) for group1, group2 in combinations
+            if assignment[group1] == assignment[group2] and not model.is_pooled(assignment[group1])]
+
+
+def repair(model, costs, assignment, combinations, max_rounds=50):
+    """
+    repair step: as long as a TA is appointed to both groups of an inconvenient combination, forbid the TA
+    for the group with most other options and solve again. Returns a schedule without violations, or None
+    """
+    costs = dict(costs)
+    for _ in range(max_rounds):
+        broken = violations(model, assignment, combinations)
+        if not broken:
+            return assignment
+        for group1, group2, person in broken:
+            group = max((group1, group2), key=lambda group: len(model.domain(group)))
+            costs.pop((group, person), None)
+        assignment, _ = min_cost_assignment(model, costs)
+        if assignment is None:
+            return None
+    return None
+
+
+def optimize_preference(model, iterations=100, base_costs=None, deadline=None):
+    """
+    find the schedule with the least amount of 'Preferably Not' with minimum cost flow and Lagrangian
+    relaxation of the inconvenient combinations.
+    Returns the solution (dictionary of group name -> TA name), its 'Preferably Not' count and the lower bound
+    on the 'Preferably Not' count of any schedule, or (None, None, None) if there is no schedule
+    base_costs: dictionary of (group, TA) -> non-negative integer cost for every available combination, to
+    minimise another cost than the 'Preferably Not' count (the count and lower bound are then in this cost)
+    deadline: Deadline (see *deadline.py*), when it has passed the best schedule so far is returned
+    """
+    if base_costs is None:
+        base_costs = {(group, person): float(model.availability[group, person] == PREFERABLY_NOT)
+                      for group in range(model.n_groups) for person in model.domain(group)}
+    combinations = inconvenient_combinations(model)
+    # penalties (Lagrange multipliers) per inconvenient combination and TA
+    penalties = {}
+
+    best_assignment = None
+    best_count = None
+    lower_bound = 0
+    step_size = 1.0
+    for _ in range(iterations):
+        if deadline is not None and deadline.expired():
+            deadline.stopped = True
+            break
+        costs = dict(base_costs)
+        for (group1, group2, person), penalty in penalties.items():
+            costs[group1, person] += penalty
+            costs[group2, person] += penalty
+        assignment, cost = min_cost_assignment(model, costs)
+        if assignment is None:
+            break  # not even the relaxation has a schedule
+
+        # the relaxation gives a lower bound for every set of penalties
+        bound = cost - sum(penalties.values())
+        lower_bound = max(lower_bound, math.ceil(bound - 1e-9))
+
+        broken = violations(model, assignment, combinations)
+        schedule = repair(model, base_costs, assignment, combinations) if broken else assignment
+        if schedule is not None:
+            count = int(sum(base_costs[group, person] for group, person in enumerate(schedule)))
+            if best_count is None or count < best_count:
+                best_assignment, best_count = schedule, count
+        if best_count is not None and best_count <= lower_bound:
+            break  # proven to be the best schedule
+
+        # subgradient step: raise the penalty of combinations that are broken, lower the others
+        subgradient = {}
+        for group1, group2 in combinations:
+            for person in set(model.domain(group1)) & set(model.domain(group2)):
+                if model.is_pooled(person):
+                    continue
+                key = (group1, group2, person)
+                value = (assignment[group1] == person) + (assignment[group2] == person) - 1
+                if value > 0 or (value < 0 and key in penalties):
+                    subgradient[key] = value
+        if not subgradient:
+            break
+        target = best_count if best_count is not None else bound + 1
+        step = step_size * max(target - bound, 1e-3) / sum(value ** 2 for value in subgradient.values())
+        for key, value in subgradient.items():
+            penalty = penalties.get(key, 0.0) + step * value
+            if penalty > 0:
+                penalties[key] = penalty
+            else:
+                penalties.pop(key, None)
+        step_size *= 0.95
+
+    if best_assignment is None:
+        return None, None, None
+    return model.to_names(best_assignment), best_count, min(lower_bound, best_count)
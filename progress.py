@@ -0,0 +1,123 @@
+import json
+import time
+
+'''
+    Progress of a running search.
+
+    The search reports every node (a value tried for a group at some depth of the search tree) and every
+    complete schedule to a SearchProgress, which counts them and keeps the position of the search in the tree:
+    the number of the value that is tried at every depth, out of the number of values at that depth.
+    The part of the tree that has been explored so far follows from this position: at depth 0 the values
+    before the current value are done, at depth 1 the values before the current value of that subtree, and so on.
+    This is an estimate, since some subtrees are much larger than others, but it grows steadily from 0 to 1.
+
+    Every interval seconds, a snapshot of the counters is passed to the callback and appended as one line of
+    JSON to the log file, so a hopeless run can be stopped early.
+'''
+
+# deeper levels change the estimate too little to be worth tracking
+MAX_TRACKED_DEPTH = 16
+
+
+class SearchProgress:
+    """
+    counters of a search, reported every interval seconds to callback (function that gets a dictionary)
+    and/or to log_path (file with one JSON object per line)
+    """
+    def __init__(self, callback=None, log_path=None, interval=5.0):
+        self.callback = callback
+        self.log_path = log_path
+        self.interval = interval
+        self.start = time.time()
+        self.last_report = self.start
+
+        self.nodes = 0
+        self.backtracks = 0
+        self.constraint_calls = 0
+        self.solutions = 0
+        self.depth = -1
+        self.max_depth = -1
+        # (number of the current value, number of values) at every tracked depth
+        self.position = []
+
+    def node(self, depth, n_values):
+        """
+        the search tries a value for a group at depth, which has n_values values to try
+        """
+        self.nodes += 1
+        if depth <= self.depth:
+            self.backtracks += 1
+        if depth < MAX_TRACKED_DEPTH:
+            if depth < len(self.position):
+                # next value at this depth, forget the deeper levels
+                index = self.position[depth][0] + 1 if depth <= self.depth else 0
+                del self.position[depth:]
+            else:
+                index = 0
+            self.position.append((index, n_values))
+        self.depth = depth
+        self.max_depth = max(self.max_depth, depth)
+        if self.nodes & 1023 == 0:
+            self.update()
+
+    def solution(self):
+        """
+        the search found a complete schedule
+        """
+        self.solutions += 1
+
+    def completion(self):
+        """
+        estimated part of the search tree that has been explored (0.0 - 1.0)
+        """
+        fraction = 0.0
+        weight = 1.0
+        for index, n_values in self.position:
+            n_values = max(n_values, index + 1)
+            fraction += weight * index / n_values
+            weight /= n_values
+        return min(fraction, 1.0)
+
+    def snapshot(self, done=False):
+        """
+        dictionary with the counters and the estimated completion
+        """
+        elapsed = time.time() - self.start
+        completion = 1.0 if done else self.completion()
+        remaining = elapsed * (1 - completion) / completion if completion > 0 else None
+        return {"elapsed": round(elapsed, 3), "nodes": self.nodes, "backtracks": self.backtracks,
+                "constraint_calls": self.constraint_calls, "solutions": self.solutions, "depth": self.depth,
+                "max_depth": self.max_depth, "completion": round(completion, 6),
+                "estimated_remaining": None if remaining is None else round(remaining, 1), "done": done}
+
+    def update(self):
+        """
+        report a snapshot if the last report is more than interval seconds ago
+        """
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def finish(self):
+        """
+        report the final snapshot
+        """
+        self.report(done=True)
+
+    def report(self, done=False):
+        self.last_report = time.time()
+        snapshot = self.snapshot(done)
+        if self.callback is not None:
+            self.callback(snapshot)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as file:
+                file.write(json.dumps(snapshot) + '\n')
+
+
+def print_progress(snapshot):
+    """
+    callback that prints a short line for every snapshot
+    """
+    remaining = snapshot["estimated_remaining"]
+    remaining = f", about {remaining / 60:.0f} minutes left" if remaining is not None and not snapshot["done"] else ""
+    print(f"{snapshot['completion'] * 100:.1f}% explored: {snapshot['nodes']} nodes, "
+          f"{snapshot['solutions']} solutions, depth {snapshot['depth']}{remaining}")
@@ -0,0 +1,150 @@
+from collections import Counter
+from model import NO, PREFERABLY_NOT
+from search import BranchAndBound
+from feasibility import filter_domains
+from preference import min_cost_assignment
+
+'''
+    Reduction of the domains that never removes a best schedule.
+
+    The rules below are applied until nothing changes anymore:
+
+        1. the flow filter of *feasibility.py*: TAs are removed from groups they can't get in any schedule
+        2. forced assignments: a group with one TA left gets that TA, and a TA that is available for exactly
+           their number of shifts gets all those groups
+        3. a forced TA is removed from the other TAs' options of its group, from the groups that can't be
+           combined with it (same time, or consecutive in another room), and from all other groups once
+           their shifts are filled
+
+    These rules only remove TA-group combinations that are part of no schedule at all. After that, dominance:
+    a short branch-and-bound search (see *search.py*) finds a good schedule (the incumbent), and a combination
+    is removed if every schedule with it is worse than the incumbent, so it can't be part of a best schedule:
+    schedules with it have fewer consecutive shifts (optimistic count of *search.py*), or as many but more
+    'Preferably Not' (lower bound with minimum cost flow, see *preference.py*). The incumbent itself is never
+    removed, so the reduced model has the same best schedules, and then rules 1-3 are applied again.
+    The short search is limited by a number of nodes instead of time, so the reduced model (which is cached,
+    see *cache.py*) is the same on every machine.
+
+    Unlike decrease_preferably_not and merging TAs (see *scheduler.py* and *merging.py*), which throw away
+    availability and can lose the best schedule or every schedule, these reductions are always applied. Only the
+    'flow' engine, which searches the schedule with the fewest 'Preferably Not' regardless of consecutive shifts,
+    skips the dominance rule (max_nodes=0), since that schedule can be worse in the ranking of the other engines.
+'''
+
+# nodes of the search for the incumbent of the dominance rule
+REDUCTION_NODES = 10000
+
+
+def reduce_model(model, max_nodes=REDUCTION_NODES, deadline=None):
+    """
+    apply the rules until nothing changes. Returns the reduced model and a dictionary with the number of
+    removed combinations per rule and the number of groups with one TA left, or (None, counts) if there is
+    no schedule at all. max_nodes: nodes of the search for the incumbent (0: no dominance rule).
+    deadline: Deadline (see *deadline.py*) that ends the dominance rule early, the model then has the same best
+    schedules but is reduced less, and counts["complete"] is False
+    """
+    counts = {"filtered": 0, "forced": 0, "dominated": 0, "fixed_groups": 0, "complete": True}
+    model = propagate(model, counts)
+    if model is not None and max_nodes > 0:
+        dominated, counts["complete"] = dominated_values(model, max_nodes, deadline)
+        if dominated:
+            counts["dominated"] = len(dominated)
+            model = propagate(model.remove(dominated), counts)
+    if model is not None:
+        counts["fixed_groups"] = sum(len(model.domain(group)) == 1 for group in range(model.n_groups))
+    return model, counts
+
+
+def propagate(model, counts):
+    """
+    apply rules 1-3 until nothing changes, returns the reduced model or None if there is no schedule
+    """
+    while True:
+        model, n_removed = filter_domains(model)
+        if model is None:
+            return None
+        counts["filtered"] += n_removed
+        removed = forced_removals(model)
+        if removed is None:
+            return None
+        if not removed:
+            return model
+        counts["forced"] += len(removed)
+        model = model.remove(removed)
+
+
+def forced_removals(model):
+    """
+    set of (group, TA) combinations that are ruled out by the forced assignments (rules 2 and 3),
+    or None if the forced assignments contradict each other
+    """
+    domains = [model.domain(group) for group in range(model.n_groups)]
+    if not all(domains):
+        return None
+    forced = {group: domain[0] for group, domain in enumerate(domains) if len(domain) == 1}
+    options = [[] for _ in range(model.n_persons)]
+    for group, domain in enumerate(domains):
+        for person in domain:
+            options[person].append(group)
+    for person, groups in enumerate(options):
+        if len(groups) < model.n_shifts[person]:
+            return None
+        if len(groups) == model.n_shifts[person]:
+            for group in groups:
+                if forced.setdefault(group, person) != person:
+                    return None  # the group is forced to two TAs
+
+    n_forced = Counter(forced.values())
+    removed = set()
+    for group, person in forced.items():
+        if n_forced[person] > model.n_shifts[person]:
+            return None
+        removed.update((group, other) for other in domains[group] if other != person)
+        if not model.is_pooled(person):
+            for other in model.conflicts(group):
+                if forced.get(other) == person:
+                    return None
+                if model.availability[other, person] != NO:
+                    removed.add((other, person))
+        if n_forced[person] == model.n_shifts[person]:
+            removed.update((other, person) for other in options[person] if forced.get(other) != person)
+    return removed
+
+
+def dominated_values(model, max_nodes, deadline=None):
+    """
+    (group, TA) combinations that can't be part of a best schedule, against the incumbent of a search of
+    max_nodes nodes, and whether all combinations were checked before the deadline (if given)
+    """
+    search = BranchAndBound(model, deadline=deadline, max_nodes=max_nodes)
+    if search.solve() is None:
+        return [], deadline is None or not deadline.stopped
+    best_consecutive, best_preferably_not = search.score()
+    costs = {(group, person): int(model.availability[group, person] == PREFERABLY_NOT)
+             for group in range(model.n_groups) for person in model.domain(group)}
+
+    bounds = BranchAndBound(model)
+    dominated = []
+    for group in range(model.n_groups):
+        domain = model.domain(group)
+        if len(domain) == 1:
+            continue
+        for person in domain:
+            if deadline is not None and deadline.expired():
+                return dominated, False
+            assignment_bounds = bounds.assignment_bounds(group, person)
+            if assignment_bounds is None:
+                dominated.append((group, person))  # forward checking already shows there is no schedule
+                continue
+            consecutive, preferably_not = assignment_bounds
+            if consecutive < best_consecutive:
+                dominated.append((group, person))
+            elif consecutive == best_consecutive:
+                if preferably_not <= best_preferably_not:
+                    fixed = {(other, value): cost for (other, value), cost in costs.items()
+                             if other != group or value == person}
+                    _, cost = min_cost_assignment(model, fixed)
+                    preferably_not = float('inf') if cost is None else round(cost)
+                if preferably_not > best_preferably_not:
+                    dominated.append((group, person))
+    return dominated, deadline is None or not deadline.stopped
@@ -0,0 +1,56 @@
+from model import PREFERABLY_NOT
+from search import BranchAndBound
+from preference import optimize_preference
+
+'''
+    Incremental repair of a published schedule after the availability has changed.
+
+    When a TA is no longer available for a group, another TA has to take the group, who then has to give
+    one of their own groups to yet another TA, and so on, until the chain reaches a TA with a shift left
+    (e.g. the TA who lost the group). Finding the shortest chains for all affected groups at once is a
+    minimum cost flow (see *preference.py*): keeping the previous TA costs nothing, any other TA costs 1
+    (and a little extra for 'Preferably Not'), so the flow changes as few groups as possible.
+
+    Only the groups in these chains are then solved again with branch-and-bound (see *search.py*), with all
+    other groups fixed to their previous TA, to get the most consecutive shifts and the least 'Preferably Not'
+    without changing more groups.
+
+    Both searches stop at a deadline (see *deadline.py*) with the best schedule so far, so a repair that needs
+    (almost) all groups to change still takes seconds instead of a full search.
+'''
+
+
+def change_costs(model, previous):
+    """
+    cost of every available (group, TA) combination: n_groups + 1 for a change of TA, plus 1 for 'Preferably Not',
+    so one change always costs more than all 'Preferably Not' together
+    """
+    weight = model.n_groups + 1
+    return {(group, person): weight * (person != previous[group])
+                             + float(model.availability[group, person] == PREFERABLY_NOT)
+            for group in range(model.n_groups) for person in model.domain(group)}
+
+
+def repair_assignment(model, previous, deadline=None):
+    """
+    repair the previous schedule (dictionary of group index -> TA index, None if the TA is gone) for the model.
+    Returns the repaired schedule (list of TA indices) and the lower bound on the number of groups that
+    have to change, or (None, None) if there is no schedule at all or none was found before the deadline
+    (Deadline, see *deadline.py*, if given)
+    """
+    weight = model.n_groups + 1
+    solution, _, lower_bound = optimize_preference(model, base_costs=change_costs(model, previous), deadline=deadline)
+    if solution is None:
+        # no schedule found with few changes, solve all groups again
+        solution = BranchAndBound(model, deadline=deadline).solve()
+        if solution is None:
+            return None, None
+        return model.to_indices(solution).tolist(), 0
+    solution = model.to_indices(solution).tolist()
+
+    # solve the changed groups again, with all other groups fixed
+    fixed = {group: person for group, person in enumerate(solution) if person == previous[group]}
+    improved = BranchAndBound(model.fix(fixed), deadline=deadline).solve()
+    if improved is not None:
+        solution = model.to_indices(improved).tolist()
+    return solution, int(lower_bound // weight)
@@ -4,8 +4,27 @@ import pandas as pd
 import numpy as np
 import itertools
 import time
+import multiprocessing
+import signal
+import contextlib
 from constraint import *
 from collections import defaultdict
+from model import ScheduleModel, AVAILABILITY_CODES, NO, PREFERABLY_NOT
+from search import BranchAndBound
+from backjump import ConflictDirectedSearch
+from feasibility import filter_domains, count_values
+from reduction import reduce_model, REDUCTION_NODES
+from preference import optimize_preference
+from lns import LargeNeighbourhoodSearch
+from symmetry import pool_interchangeable, split_pooled
+from merging import availability_codes, similarity_matrix, auto_merge_employee_availability, write_merge_log
+from cache import ScheduleCache, dataframe_key, derived_key
+from repair import repair_assignment
+from courses import joint_assignment
+from progress import SearchProgress, print_progress
+from deadline import Deadline, SearchStopped
+from workbooks import write_workbook
+from estimate import estimate_search, choose_strategy, format_estimate, format_seconds, DEFAULT_TIME_BUDGET, ESTIMATE_TIME
 
 pd.set_option('future.no_silent_downcasting', True)
 
@@ -40,17 +59,53 @@ pd.set_option('future.no_silent_downcasting', True)
     Thus, some preprocessing is required. See the example dataframe for the requirements.
 
 '''
+# number of solutions that process_solutions scores at once
+SCORE_BATCH_SIZE = 65536
+
 ####### Main function to generate schedule #######
 def generate_schedule(dataframe, suffix = None, required_columns = int(9),
-                      min_availability_ratio = float(0.5),consecutive_ratio = float(0.4)):
+                      min_availability_ratio = None,consecutive_ratio = float(0.4), engine = 'auto',
+                      n_workers = int(1), merge = None, cache_dir = None, cache = None,
+                      progress = None, progress_log = None, time_limit = None, deadline = None):
     """
     main function to generate the schedule
+    engine: 'auto' (default) estimates how long the search takes (see *estimate.py*) and chooses the engine
+    and whether to search all solutions, so that the schedule is expected within the time limit (or 10 minutes).
+    'bnb' finds the best schedule with branch-and-bound, 'csp' enumerates all solutions
+    and ranks them afterwards (if the enumeration is predicted to fit in time, otherwise it finds the first solution),
+    'flow' finds the schedule with the least 'Preferably Not' with minimum cost flow (any number
+    of groups, consecutive shifts are not taken into account), 'lns' improves a schedule with large
+    neighbourhood search for a minute (any number of groups), 'cbj' searches as 'bnb' but jumps back to
+    the cause of a dead end and learns which combinations of TAs fail (see *backjump.py*), for tight instances
+    n_workers: number of processes that search in parallel (None uses all cores)
+    The domains are always reduced without losing the best schedule (see *reduction.py*). Two lossy fallbacks,
+    which can lose the best schedule or even every schedule, are only applied when they are switched on and the
+    search is predicted to take longer than the time limit:
+    merge: how TAs are merged when there are more than 9 TAs, 'interactive' asks which TAs to merge,
+    'auto' merges them without asking (see *merging.py*) and writes a log of the merges (None: never merge)
+    min_availability_ratio: 'Preferably Not' is set to 'No' for TAs that are available for more than this ratio
+    of the groups, in groups with enough other TAs (see decrease_preferably_not; None: never)
+    cache_dir: directory of a cache (see *cache.py*) for the preprocessed model and the schedule, so that
+    a rerun with the same dataframe and parameters (including time_limit) skips the preprocessing and the search
+    (None: no cache)
+    cache: a cache object to use instead of cache_dir, e.g. a MemoryCache (see *cache.py*) shared by many runs
+    progress: function that gets the counters of the search every 5 seconds (see *progress.py*), e.g.
+    print_progress, and progress_log: file to which the counters are appended as JSON lines
+    time_limit: seconds the schedule may take, and/or deadline: time (time.time()) it has to be done, or a
+    Deadline (see *deadline.py*) that is used instead of both, e.g. to cancel the search from another thread
+    (time_limit is then only used for the key of the cache).
+    When the time is up, or on Ctrl+C, the best schedule found so far is returned. Whether the schedule
+    is proven to be the best one (never after a lossy fallback) is printed and stored in df.attrs["optimal"]
     """
 
     if consecutive_ratio <= 0.0 or consecutive_ratio >= 1.0:
         sys.exit("consecutive_ratio must be between 0.0 and 1.0")
-    if min_availability_ratio <= 0.0 or min_availability_ratio >= 1.0:
-        sys.exit("min_availability_ratio must be between 0.0 and 1.0")
+    if min_availability_ratio is not None and (min_availability_ratio <= 0.0 or min_availability_ratio >= 1.0):
+        sys.exit("min_availability_ratio must be between 0.0 and 1.0, or None")
+    if engine not in ('auto', 'bnb', 'csp', 'flow', 'lns', 'cbj'):
+        sys.exit("engine must be 'auto', 'bnb', 'csp', 'flow', 'lns' or 'cbj'")
+    if merge not in (None, 'interactive', 'auto'):
+        sys.exit("merge must be None, 'interactive' or 'auto'")
 
     if suffix is not None:
         suffix = str(suffix)
@@ -59,60 +114,345 @@ def generate_schedule(dataframe, suffix = None, required_columns = int(9),
 
     start = time.time()
     df = dataframe
+    if isinstance(deadline, Deadline):
+        search_deadline = deadline
+    else:
+        search_deadline = Deadline(time_limit=time_limit, deadline=deadline)
 
     # check whether columns of dataframe have the correct names and structure
     check_input_range(df)
     check_structure(df)
 
+    # the result of interactive merging depends on the choices, so it can't be cached
+    if cache is not None or cache_dir is not None:
+        if len(df.columns[5:]) > 9 and merge == 'interactive':
+            print("Interactive merging can't be cached, use merge='auto' to cache this schedule")
+            cache = None
+        elif cache is None:
+            cache = ScheduleCache(cache_dir)
+
+    # the schedule is looked up before anything is computed. How it is found depends on the time the search has,
+    # so the key has the time limit, and a schedule with an end that the time limit didn't set isn't cached
+    # (a Deadline without an end, e.g. one that can only be cancelled, is cached)
+    cached = None
+    solution_key = None
+    if cache is not None and (search_deadline.end is None or time_limit is not None):
+        solution_key = dataframe_key(df, required_columns=required_columns,
+                                     min_availability_ratio=min_availability_ratio, merge=merge, engine=engine,
+                                     consecutive_ratio=consecutive_ratio, n_workers=n_workers, time_limit=time_limit)
+        cached = cache.get(solution_key)
+    if cached is not None:
+        print("Found the schedule in the cache")
+        solution, optimal, fallbacks = cached
+    else:
+        search_progress = None
+        if progress is not None or progress_log is not None:
+            search_progress = SearchProgress(callback=progress, log_path=progress_log)
+        solution, optimal, fallbacks = find_schedule(df, required_columns, min_availability_ratio, consecutive_ratio,
+                                                     engine, n_workers, merge, cache, search_progress, search_deadline)
+        # a schedule of a search that was stopped can be improved by the next run, so it isn't cached
+        if solution_key is not None and not search_deadline.stopped:
+            cache.put(solution_key, (solution, optimal, fallbacks))
+    if fallbacks["merge_log"]:
+        write_merge_log(fallbacks["merge_log"], suffix)
+
+    if optimal:
+        print("The schedule is proven to be the best schedule")
+    elif search_deadline.stopped:
+        print("The search was stopped, the schedule is the best one found so far")
+    if fallbacks["merged"] or fallbacks["preferably_not_removed"]:
+        print("TAs were merged and/or 'Preferably Not' was set to 'No' to save time, so the schedule is not "
+              "proven to be the best schedule")
+
+    # create dataframe to output solution to Excel
+    df = dict_to_dataframe(solution, df)
+    if fallbacks["merged"]:
+        df.loc[df["TA"].str.contains("-"), "Warning"] = "don't forget to split TAs again"
+    df.attrs["optimal"] = optimal
+
+    write_excel(df, suffix)
+    print('It took {0:0.1f} seconds'.format(time.time() - start))
+    return df
+
+
+def find_schedule(df, required_columns, min_availability_ratio, consecutive_ratio, engine, n_workers, merge,
+                  cache=None, progress=None, deadline=None):
     """
-    if number of employees is larger than 9, merge TA availability
+    preprocess the dataframe and search the schedule, with the parameters of generate_schedule.
+    Returns the schedule (dictionary of group name -> TA name), whether it is proven to be the best one,
+    and the lossy fallbacks that were applied (see preprocess)
     """
-    employee_columns = df.columns[5:]
-    num_employees = len(employee_columns)
-    merged = False
-    if num_employees > 9:  # only do this when number of TAs is larger than 9, otherwise not necessary
-        df, merged = merge_employee_availability(df, required_columns=required_columns)
+    if deadline is None:
+        deadline = Deadline()
+    # the dominance rule keeps the best schedules of the ranking, which aren't the ones with the fewest 'Preferably Not'
+    # that the 'flow' engine searches
+    model, pools, estimate, fallbacks = preprocess(df, required_columns, min_availability_ratio, merge,
+                                                   deadline, cache, dominance=engine != 'flow')
+    print(format_estimate(estimate))
 
     """
-    if the number of groups is larger than 16 (arbitrary cut-off), find the first solution. Typically this solution is
-    already near ideal.
+    search all solutions if that is predicted to be done in time, otherwise find the first solution.
+    Typically this solution is already near ideal.
     """
-    n_groups = df.shape[0]
-    if n_groups > 16:
-        all_solutions = False
-    else:
-        all_solutions = True
+    budget = deadline.remaining(default=DEFAULT_TIME_BUDGET)
+    requested_engine = engine
+    engine, all_solutions = choose_strategy(estimate, budget, engine)
+    if requested_engine == 'auto':
+        print(f"Using engine '{engine}' to find {'the best schedule' if all_solutions else 'a schedule'} "
+              f"within {format_seconds(budget)}")
+
+    with deadline.catch_interrupt():
+        solution = extract_schedule(model, all_solutions, consecutive_ratio, engine, n_workers,
+                                    progress=progress, deadline=deadline)
+    if not solution and deadline.stopped:
+        sys.exit("No solutions found before the time was up")
+    if not solution:
+        sys.exit("No solutions found, check your dataframe!")
 
-    # decrease preferably not rate
-    df = decrease_preferably_not(df,min_availability_ratio=min_availability_ratio)
+    # only a complete search over all solutions of the unchanged availability proves that the schedule is the best one
+    lossy = fallbacks["merged"] or fallbacks["preferably_not_removed"] > 0
+    optimal = all_solutions and engine in ('bnb', 'csp', 'cbj') and not deadline.stopped and not lossy
+    return split_pooled(solution, pools), optimal, fallbacks
+
+
+def repair_schedule(dataframe, previous, suffix = None, time_limit = float(60), deadline = None):
+    """
+    repair a published schedule after the availability has changed (see *repair.py*): only the groups
+    that can't keep their TA, and the groups that have to make room for them, get a new TA.
+    dataframe: the new availability, with the same structure as for generate_schedule
+    previous: the previous schedule, e.g. the output workbook of generate_schedule (columns 'Group' and 'TA')
+    time_limit and deadline as for generate_schedule, by default the repair takes at most a minute
+    """
+    if suffix is not None:
+        suffix = str(suffix)
+    elif suffix is None:
+        suffix = str(input("Please specify a suffix for the schedule: "))
+
+    start = time.time()
+    df = dataframe
+    search_deadline = Deadline(time_limit=time_limit, deadline=deadline)
+    check_input_range(df)
+    check_structure(df)
 
-    # CSP setup
-    solutions = extract_solutions(df, all_solutions, consecutive_ratio)
-    if not solutions:
+    # no lossy preprocessing, the previous TAs must still be options
+    model = create_schedule_model(df)
+    model, _ = filter_domains(model)
+    if model is None:
+        sys.exit("No solutions found, the groups can't be divided over the available TAs with their number of shifts. Check your dataframe!")
+
+    previous_tas = dict(zip(previous["Group"], previous["TA"]))
+    previous_assignment = {group: model.person_index.get(previous_tas.get(name))
+                           for group, name in enumerate(model.groups)}
+    print("Repairing schedule, please wait")
+    with search_deadline.catch_interrupt():
+        solution, lower_bound = repair_assignment(model, previous_assignment, deadline=search_deadline)
+    if solution is None and search_deadline.stopped:
+        sys.exit("No repaired schedule found before the time was up, try a longer time_limit")
+    if solution is None:
         sys.exit("No solutions found, check your dataframe!")
-    elif isinstance(solutions, dict):
-        # immediately return dataframe
-        solution = solutions
-    else:
-        solution = process_solutions(solutions, df)
+    if search_deadline.stopped:
+        print("The repair was stopped, the schedule is the best one found so far")
 
-    # create dataframe to output solution to Excel
-    df = dict_to_dataframe(solution, df)
-    if merged:
-        df.loc[df["TA"].str.contains("-"), "Warning"] = "don't forget to split TAs again"
+    df = dict_to_dataframe(model.to_names(solution), df)
+    df["Previous TA"] = df["Group"].map(previous_tas)
+    df["Changed"] = df["TA"] != df["Previous TA"]
+    print(f"Changed the TA of {int(df['Changed'].sum())} of {len(df)} groups "
+          f"(at least {lower_bound} had to change)")
 
     write_excel(df, suffix)
     print('It took {0:0.1f} seconds'.format(time.time() - start))
     return df
 
 
+def generate_joint_schedule(dataframes, suffix = None, time_limit = None, deadline = None):
+    """
+    generate the schedules of several courses that share TAs together (see *courses.py*), so that no TA has
+    groups of different courses at the same time and every TA gets their shifts of all courses together.
+    dataframes: dictionary of course name -> dataframe, with the same structure as for generate_schedule.
+    A TA is recognised by their name in all courses, and the shifts of a TA can move between the courses.
+    time_limit and deadline as for generate_schedule. Returns a dictionary of course name -> schedule,
+    every schedule is written to output/schedule_<suffix>_<course>.xlsx
+    """
+    if suffix is not None:
+        suffix = str(suffix)
+    elif suffix is None:
+        suffix = str(input("Please specify a suffix for the schedule: "))
+
+    start = time.time()
+    search_deadline = Deadline(time_limit=time_limit, deadline=deadline)
+    combined, course_groups = combine_courses(dataframes)
+    model = create_schedule_model(combined)
+    model, _ = filter_domains(model)
+    if model is None:
+        sys.exit("No solutions found, the groups of the courses can't be divided over the TAs with their number of shifts. Check your dataframes!")
+
+    print(f"Scheduling {len(dataframes)} courses with {model.n_groups} groups and {model.n_persons} TAs "
+          f"together, please wait")
+    course_groups = [[model.group_index[group] for group in groups] for groups in course_groups]
+    with search_deadline.catch_interrupt():
+        solution, score = joint_assignment(model, course_groups, deadline=search_deadline)
+    if solution is None:
+        sys.exit("No solutions found, check your dataframes!")
+    print(f"Consecutive shifts: {score[0]}, 'Preferably Not' count: {score[1]}")
+
+    solution = model.to_names(solution)
+    schedules = {}
+    for course, df in dataframes.items():
+        course_solution = {group: solution[f"{course}: {group}"] for group in df["Group"]}
+        schedules[course] = dict_to_dataframe(course_solution, df)
+        write_excel(schedules[course], f"{suffix}_{course}")
+    print('It took {0:0.1f} seconds'.format(time.time() - start))
+    return schedules
+
+
+def preprocess(df, required_columns, min_availability_ratio, merge, deadline=None, cache=None, stage=None,
+               dominance=True):
+    """
+    build the model, reduce it without losing the best schedule, and estimate the search (see *estimate.py*).
+    Only if the search is predicted not to find a schedule before the deadline (or within 10 minutes), the lossy
+    fallbacks that are switched on are applied (see apply_fallbacks) and the model is built again.
+    cache: cache (see *cache.py*) for the models. The models with and without the fallbacks have their own key,
+    so whether a cached model has the fallbacks never depends on the time an earlier run had.
+    stage: function that returns a context manager for a named stage ('model', 'estimate', 'fallbacks'),
+    e.g. to time the stages (see *benchmark/runner.py*)
+    dominance: whether the reduction applies the dominance rule (see build_model)
+    Returns the model, the pooled TAs, the estimate and the fallbacks that were applied: a dictionary with the
+    log of automatic merges, whether TAs were merged and the number of 'Preferably Not' that were set to 'No'
+    """
+    if deadline is None:
+        deadline = Deadline()
+    if stage is None:
+        stage = lambda name: contextlib.nullcontext()
+    model_key = dataframe_key(df, dominance=dominance)
+    with stage("model"):
+        model, pools = cached_entry(cache, model_key, lambda: build_model(df, deadline, dominance))
+    with stage("estimate"):
+        estimate = estimate_search(model, deadline.share(ESTIMATE_TIME))
+    fallbacks = {"merge_log": [], "merged": False, "preferably_not_removed": 0}
+
+    can_merge = merge is not None and len(df.columns[5:]) > 9
+    if not can_merge and min_availability_ratio is None:
+        return model, pools, estimate, fallbacks
+    if choose_strategy(estimate, deadline.remaining(default=DEFAULT_TIME_BUDGET))[0] != 'lns':
+        return model, pools, estimate, fallbacks
+
+    print(f"{format_estimate(estimate)}, so the lossy fallbacks that are switched on are applied")
+    fallback_key = derived_key(model_key, required_columns=required_columns,
+                               min_availability_ratio=min_availability_ratio, merge=merge)
+    with stage("fallbacks"):
+        model, pools, fallbacks = cached_entry(cache, fallback_key, lambda: apply_fallbacks(
+            df.copy(), required_columns, min_availability_ratio, merge, deadline, dominance))
+    with stage("estimate"):
+        estimate = estimate_search(model, deadline.share(ESTIMATE_TIME))
+    return model, pools, estimate, fallbacks
+
+
+def apply_fallbacks(df, required_columns, min_availability_ratio, merge, deadline=None, dominance=True):
+    """
+    apply the lossy fallbacks that are switched on to the dataframe: merging TAs (merge, if there are more than
+    9 TAs) and decreasing the number of 'Preferably Not' (min_availability_ratio), and build the model again.
+    Returns the model, the pooled TAs, the fallbacks that were applied (see preprocess) and whether the
+    reduction was complete (see build_model)
+    """
+    fallbacks = {"merge_log": [], "merged": False, "preferably_not_removed": 0}
+    if merge is not None and len(df.columns[5:]) > 9:
+        """
+        if number of employees is larger than 9, merge TA availability
+        """
+        if merge == 'auto':
+            df, fallbacks["merge_log"] = auto_merge_employee_availability(df, required_columns=required_columns)
+            fallbacks["merged"] = bool(fallbacks["merge_log"])
+        else:
+            df, fallbacks["merged"] = merge_employee_availability(df, required_columns=required_columns)
+
+    # decrease preferably not rate
+    if min_availability_ratio is not None:
+        df, report = decrease_preferably_not(df,min_availability_ratio=min_availability_ratio)
+        fallbacks["preferably_not_removed"] = len(report)
+    model, pools, complete = build_model(df, deadline, dominance)
+    return model, pools, fallbacks, complete
+
+
+def cached_entry(cache, key, build):
+    """
+    the entry with key of the cache (if given), or the entry that build() returns together with whether it
+    is complete. Only complete entries are cached, so a cached entry never depends on the time a run had
+    """
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        print("Found the preprocessed model in the cache")
+        return cached
+    *entry, complete = build()
+    if cache is not None and complete:
+        cache.put(key, tuple(entry))
+    return tuple(entry)
+
+
+def build_model(df, deadline=None, dominance=True):
+    """
+    build the model, pool interchangeable TAs and reduce the domains (see *reduction.py*).
+    deadline: Deadline (see *deadline.py*) of the search, the dominance rule of the reduction takes at most
+    a tenth of its remaining time.
+    dominance: whether to apply the dominance rule, which keeps the best schedules (most consecutive shifts, then
+    fewest 'Preferably Not') but can remove the schedules with the fewest 'Preferably Not' (False for 'flow')
+    Returns the model, the pooled TAs and whether the reduction was complete
+    """
+    if deadline is None:
+        deadline = Deadline()
+    model = create_schedule_model(df)
+
+    # solve interchangeable TAs as one TA, their groups are divided over them again afterwards
+    model, pools = pool_interchangeable(model)
+    if pools:
+        print(f"Pooled interchangeable TAs: {', '.join('+'.join(names) for names in pools.values())}")
+
+    # check whether the shifts can cover all groups, and remove TAs from groups they can never get in a best schedule
+    n_values = count_values(model)
+    model, counts = reduce_model(model, max_nodes=REDUCTION_NODES if dominance else 0,
+                                 deadline=Deadline(time_limit=deadline.share()))
+    if model is None:
+        sys.exit("No solutions found, the groups can't be divided over the available TAs with their number of shifts. Check your dataframe!")
+    n_removed = counts["filtered"] + counts["forced"] + counts["dominated"]
+    print(f"Removed {n_removed} of {n_values} TA-group combinations that can't be part of a best schedule "
+          f"({counts['dominated']} that can only be part of worse schedules), {counts['fixed_groups']} groups "
+          f"have one TA left")
+    return model, pools, counts["complete"]
+
+
+def extract_schedule(model, all_solutions, consecutive_ratio, engine='bnb', n_workers=1, progress=None,
+                     deadline=None):
+    """
+    extract the solution with the engine (see generate_schedule)
+    progress: SearchProgress (see *progress.py*) for the 'bnb', 'csp' and 'cbj' engines on 1 core, if given
+    deadline: Deadline (see *deadline.py*), when it has passed the best solution so far is returned
+    """
+    if engine == 'flow':
+        return extract_preference_solution(model, deadline)
+    if engine == 'lns':
+        return extract_lns_solution(model, deadline=deadline)
+    if n_workers is None or n_workers > 1:
+        return extract_solutions_parallel(model, all_solutions, consecutive_ratio,
+                                          engine=engine, n_workers=n_workers, deadline=deadline)
+    if engine == 'cbj':
+        return extract_backjump_solution(model, all_solutions, consecutive_ratio, progress, deadline)
+    if all_solutions and engine == 'bnb':
+        # find the best solution directly, instead of ranking all solutions afterwards
+        return extract_best_solution(model, progress, deadline)
+    if all_solutions:
+        # solutions are ranked while they are found, only the best one is kept in memory
+        solutions = extract_solutions(model, all_solutions, consecutive_ratio, stream=True, progress=progress,
+                                      deadline=deadline)
+        return process_solutions(solutions, model)
+    return extract_solutions(model, all_solutions, consecutive_ratio, progress=progress, deadline=deadline)
+
+
 ### helper and utility functions ####
 def check_input_range(df):
     """
     check whether the availability input is limited to 'Yes', 'Preferably Not', and 'No'
     """
     allowed_input = ['Yes', 'No', 'Preferably Not', np.nan]
-    if not df[:, 5:].isin(allowed_input).all():
+    if not df.iloc[:, 5:].isin(allowed_input).all().all():
         sys.exit("Please only use 'Yes', 'Preferably Not' or 'No' as input")
 
 
@@ -127,51 +467,84 @@ def check_structure(df):
         sys.exit("First 5 columns do not match: 'Day','Time', 'Group', 'Location', 'Room'")
 
 
-def create_team_availability(df):
+def combine_courses(dataframes):
+    """
+    combine the dataframes of courses that share TAs (dictionary of course name -> dataframe) into one dataframe.
+    Groups are renamed to '<course>: <group>', every TA gets one column with their shifts of all courses
+    together, and is 'No' for the groups of the courses they don't teach.
+    Returns the combined dataframe and the list of (renamed) groups of every course
+    """
+    columns = ['Day', 'Time', 'Group', 'Location', 'Room']
+    frames = []
+    course_groups = []
+    n_shifts = defaultdict(int)
+    for course, df in dataframes.items():
+        check_input_range(df)
+        check_structure(df)
+        persons = {}
+        for person_n in df.columns[5:]:
+            person, shifts = split_person_shifts(person_n)
+            persons[person_n] = person
+            n_shifts[person] += shifts
+        df = df[columns + list(persons)].rename(columns=persons)
+        df["Group"] = [f"{course}: {group}" for group in df["Group"]]
+        frames.append(df)
+        course_groups.append(df["Group"].tolist())
+
+    combined = pd.concat(frames, ignore_index=True)
+    combined = combined[columns + list(n_shifts)]
+    combined[list(n_shifts)] = combined[list(n_shifts)].fillna('No')
+    combined = combined.rename(columns={person: f"{person}_{shifts}" for person, shifts in n_shifts.items()})
+    return combined, course_groups
+
+
+def split_person_shifts(person_n):
+    """
+    split a TA column name 'name_n' into the name and the number of shifts 'n'
+    """
+    if "_" not in person_n:
+        sys.exit("number of shifts not indicated by suffix '_n', where 'n' is number of shifts")
+    n_shifts = person_n.split('_')[1]
+    if not float(n_shifts).is_integer():
+        sys.exit("number of shifts not indicated by suffix '_n', where 'n' is number of shifts")
+    return person_n.split('_')[0], int(n_shifts)
+
+
+def create_schedule_model(df):
     """
-    create team dictionary where each team member has their availability (values) linked to the timeslot (keys)
+    create the model (see *model.py*) with the groups, TAs, availability and constraints of the dataframe.
+    It is built once and shared by all stages that extract and process solutions
     """
-    team = {}
-    # loop over employees
+    persons = []
+    n_shifts = []
     for person_n in df.columns[5:]:  # make sure that columns from column 6 onwards are the names
-        if "_" not in person_n:
-            sys.exit("number of shifts not indicated by suffix '_n', where 'n' is number of shifts")
-        n_shifts = person_n.split('_')[1]
-        if not float(n_shifts).is_integer():
-            sys.exit("number of shifts not indicated by suffix '_n', where 'n' is number of shifts")
-        n_shifts = int(n_shifts)
-
-        person = person_n.split('_')[0]
-        team[person] = {}
-        team[person]['n_shifts'] = n_shifts
-        team[person]['availability'] = {}
-        for group in df["Group"]:
-            # store availability
-            availability = df[(df['Group'] == group)][person_n].values
-            if len(availability) > 0:
-                team[person]['availability'][group] = availability[0]
-            else:
-                team[person]['availability'][group] = 'No'  # in case of NA
+        person, shifts = split_person_shifts(person_n)
+        persons.append(person)
+        n_shifts.append(shifts)
 
     # check whether total number of shifts corresponds with total number of groups
-    total_shifts = sum(person_info['n_shifts'] for person_info in team.values())
-    n_groups = df.shape[0]
-    if total_shifts != n_groups:
+    if sum(n_shifts) != df.shape[0]:
         sys.exit("total amount of shifts over all TAs not equal to number of groups, which is a requirement for this script to run. Check your dataframe")
-    return team
 
+    # 'No' and missing values are both stored as NO
+    values = df.iloc[:, 5:].to_numpy(dtype=object)
+    availability = np.full(values.shape, NO, dtype=np.int8)
+    for answer, code in AVAILABILITY_CODES.items():
+        availability[values == answer] = code
 
-def count_plus1shift(df):
-    """
-    count number of individuals with more than 1 shift
-    """
-    num_plus1shift = 0
-    for person_n in df.columns[5:]:  # make sure that columns from column 6 onwards are the names
-        n_shifts = person_n.split('_')[1]
-        n_shifts = int(n_shifts)
-        if n_shifts > 1:
-            num_plus1shift += 1
-    return num_plus1shift
+    incompatible_groups = extract_incompatible_combinations(df)
+    consecutive_groups, consecutive_inconvenient = extract_consecutive_combinations(df)
+
+    # groups on the same day and time share a time slot
+    slots = pd.factorize(df["Day"].astype(str) + " " + df["Time"].astype(str))[0]
+
+    return ScheduleModel(groups=df["Group"].tolist(),
+                         persons=persons,
+                         n_shifts=n_shifts,
+                         availability=availability,
+                         incompatible_combinations=incompatible_groups + consecutive_inconvenient,
+                         consecutive_groups=consecutive_groups,
+                         slots=slots)
 
 
 def extract_incompatible_combinations(dataframe):
@@ -238,7 +611,7 @@ def dict_to_dataframe(schedule_dict, original_df):
 
 def write_excel(df, suffix):
     """
-    write dataframe to excel
+    write dataframe to excel, streamed (see *workbooks.py*)
     """
     cd = os.getcwd()
     output_path = os.path.join(cd, 'output')
@@ -246,187 +619,687 @@ def write_excel(df, suffix):
         os.mkdir(output_path)
     output_file = f'schedule_{suffix}.xlsx'
     full_path = os.path.join(output_path, output_file)
-    df.to_excel(os.path.join(full_path))
+    write_workbook(df, full_path)
     print(f'Final schedule created and written to "{full_path}"')
 
 
 ### Functions to extract solutions ###
-def custom_constraint(*values,
-                      list_of_groups,
-                      incompatible_combinations,
-                      consecutive_groups,
-                      plus1shift,
-                      consecutive_ratio = float(),
-                      team_dict,
-                      all_solutions):
+class ScheduleConstraint(Constraint):
     """
-    custom constraint with nested checks
+    constraint of the schedule, which counts its calls in progress (see *progress.py*) if it is given
     """
-    consecutive_count = int(0)
-    solution = defaultdict(list)
+    progress = None
+
+    def _count_call(self):
+        if self.progress is not None:
+            self.progress.constraint_calls += 1
 
-    for value, group in zip(values, list_of_groups):
-        solution[value].append(group)
-    solution = dict(solution)
 
+class MonitorConstraint(Constraint):
     """
-    this constraint checks whether number of shifts is equal to the number of appointed groups
+    constraint on all groups that is always satisfied. It is checked first for every value the solver
+    tries, so it reports every node of the search tree to progress (see *progress.py*), and stops the
+    search when the deadline (see *deadline.py*) has passed
     """
-    compatible = True
-    for person, groups in solution.items():
-       if team_dict[person]['n_shifts'] != len(groups):
-           compatible = False
-           return compatible
+    def __init__(self, progress=None, deadline=None):
+        self._progress = progress
+        self._deadline = deadline
 
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        if self._deadline is not None:
+            self._deadline.check()
+        if self._progress is not None:
+            # the group that is assigned last is the one the solver is trying a value for
+            group = next(reversed(assignments))
+            self._progress.node(len(assignments) - 1, len(domains[group]))
+        return True
+
+
+class ShiftCountConstraint(ScheduleConstraint):
     """
-    this constraint checks whether incompatible combinations are in the solution
-    additionally it counts the number of consecutive shifts for a TA, which is used
-    for the final constraint
+    constraint that checks whether a TA is appointed to exactly n_shifts of the groups
+    in its scope. Partial assignments are rejected as soon as the TA has too many groups,
+    or too few groups are left open to still reach n_shifts.
     """
-    for groups in solution.values():
-        if len(groups) == 1:
-            continue
-
-        elif len(groups) == 2:
-            groups = sorted(groups)
-            if groups in incompatible_combinations:
-                compatible = False
-                return compatible
-            # count number of consecutive groups
-            if not all_solutions:
-                if groups in consecutive_groups:
+    def __init__(self, person, n_shifts, progress=None):
+        self._person = person
+        self._n_shifts = n_shifts
+        self.progress = progress
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        self._count_call()
+        person = self._person
+        n_shifts = self._n_shifts
+
+        count = 0
+        open_groups = []
+        for group in variables:
+            if group in assignments:
+                if assignments[group] == person:
+                    count += 1
+            elif person in domains[group]:
+                open_groups.append(group)
+
+        if count > n_shifts or count + len(open_groups) < n_shifts:
+            return False
+
+        if forwardcheck and open_groups:
+            if count == n_shifts:
+                # all shifts are filled, so the TA can't take any of the open groups
+                for group in open_groups:
+                    domain = domains[group]
+                    domain.hideValue(person)
+                    if not domain:
+                        return False
+            elif count + len(open_groups) == n_shifts:
+                # the TA needs every open group it is still available for
+                for group in open_groups:
+                    domain = domains[group]
+                    for value in domain[:]:
+                        if value != person:
+                            domain.hideValue(value)
+        return True
+
+
+class IncompatibleConstraint(ScheduleConstraint):
+    """
+    constraint that checks whether two incompatible groups are not appointed to the same TA.
+    Pooled TAs (see *symmetry.py*) stand for several TAs with 1 shift, so they can take both groups
+    """
+    def __init__(self, pooled, progress=None):
+        self._pooled = pooled
+        self.progress = progress
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        self._count_call()
+        group1, group2 = variables
+        if group1 in assignments and group2 in assignments:
+            return assignments[group1] != assignments[group2] or assignments[group1] in self._pooled
+
+        if forwardcheck:
+            for assigned, other in ((group1, group2), (group2, group1)):
+                if assigned in assignments and other not in assignments:
+                    person = assignments[assigned]
+                    domain = domains[other]
+                    if person not in self._pooled and person in domain:
+                        domain.hideValue(person)
+                        if not domain:
+                            return False
+        return True
+
+
+class ConsecutiveRatioConstraint(ScheduleConstraint):
+    """
+    constraint that checks whether the ratio of consecutive groups (same TA) to the number
+    of TAs with more than 1 shift can still become larger than consecutive_ratio.
+    Partial assignments are rejected once even the optimistic count is too low.
+    """
+    def __init__(self, consecutive_groups, plus1shift, consecutive_ratio, pooled=(), progress=None):
+        self._consecutive_groups = consecutive_groups
+        self._plus1shift = plus1shift
+        self._consecutive_ratio = consecutive_ratio
+        self._pooled = set(pooled)
+        self.progress = progress
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        self._count_call()
+        # optimistic count: pairs that are, or can still become, appointed to the same TA
+        consecutive_count = 0
+        for shift1, shift2 in self._consecutive_groups:
+            if shift1 in assignments and shift2 in assignments:
+                if assignments[shift1] == assignments[shift2] and assignments[shift1] not in self._pooled:
+                    consecutive_count += 1
+            elif shift1 in assignments:
+                if assignments[shift1] in domains[shift2]:
+                    consecutive_count += 1
+            elif shift2 in assignments:
+                if assignments[shift2] in domains[shift1]:
                     consecutive_count += 1
+            elif not set(domains[shift1]).isdisjoint(domains[shift2]):
+                consecutive_count += 1
+
+        consecutive_ratio_sol = consecutive_count / self._plus1shift
+        return consecutive_ratio_sol > self._consecutive_ratio
 
-        elif len(groups) > 2:
-            groups = list(itertools.combinations(groups, 2))
-            for combination in groups:
-                combination = sorted(combination) # otherwise doesn't work properly, not sure why since itertools.comb should do this automatically
-                if combination in incompatible_combinations:
-                    compatible = False
-                    return compatible
-                # count number of consecutive groups
-                if not all_solutions:
-                    if combination in consecutive_groups:
-                        consecutive_count += 1
 
+def add_schedule_constraints(problem, domains, model, consecutive_ratio, all_solutions, progress=None,
+                             deadline=None):
     """
-    this constraint checks whether the ratio of consecutive groups is larger
-    than the threshold. It only does this if only 1 solution is required.
-    This ensures that the sole solution is of slightly higher quality.
+    add the scheduling constraints to the CSP. Every constraint only looks at the groups it
+    concerns, so the solver can reject partial assignments and forward-check domains:
+        - per TA, the number of appointed groups equals the number of shifts
+        - groups that take place at the same time (or are consecutive in different rooms)
+          can't be appointed to the same TA
+        - only if 1 solution is required: the ratio of consecutive groups is larger than
+          consecutive_ratio, which ensures that the sole solution is of slightly higher quality
+    returns False if a TA can never get their number of shifts, in which case there are no solutions
+    progress: SearchProgress (see *progress.py*) that receives every node and constraint call, if given
+    deadline: Deadline (see *deadline.py*) that stops the search, if given
     """
+    if progress is not None or deadline is not None:
+        problem.addConstraint(MonitorConstraint(progress, deadline), list(domains))
+
+    for person, n_shifts in zip(model.persons, model.n_shifts.tolist()):
+        scope = [group for group, domain in domains.items() if person in domain]
+        if len(scope) < n_shifts:
+            return False
+        if scope:
+            problem.addConstraint(ShiftCountConstraint(person, n_shifts, progress), scope)
+
+    pooled = {person for index, person in enumerate(model.persons) if model.is_pooled(index)}
+    for combination in model.incompatible_names():
+        if pooled or progress is not None:
+            problem.addConstraint(IncompatibleConstraint(pooled, progress), list(combination))
+        else:
+            problem.addConstraint(AllDifferentConstraint(), list(combination))
+
     if not all_solutions:
-        consecutive_ratio_sol = consecutive_count / plus1shift
-        if consecutive_ratio_sol <= consecutive_ratio:
-            compatible = False
-    return compatible
+        plus1shift = model.n_plus1shift
+        consecutive_pairs = model.consecutive_names()
+        scope = sorted(set(itertools.chain.from_iterable(consecutive_pairs)))
+        if plus1shift > 0:
+            if not scope:  # without consecutive groups the ratio is 0, which is never large enough
+                return False
+            problem.addConstraint(ConsecutiveRatioConstraint(consecutive_pairs, plus1shift,
+                                                             consecutive_ratio, pooled, progress), scope)
+    return True
+
+
+class ScheduleSolver(OptimizedBacktrackingSolver):
+    """
+    backtracking solver with forward checking that chooses the next group and the order of its TAs
+    while searching, instead of once beforehand:
+        - group: the fewest TAs left (minimum remaining values), ties broken by the most open groups
+          at the same time (degree), and then by the fewest shifts left of its TAs
+        - TA: first the TAs that make a consecutive pair with an appointed group, then 'Yes' before
+          'Preferably Not', so the first solution is usually already a good one
+    """
+    def __init__(self, model, forwardcheck=True):
+        super().__init__(forwardcheck)
+        self._n_shifts = dict(zip(model.persons, model.n_shifts.tolist()))
+        self._pooled = {person for index, person in enumerate(model.persons) if model.is_pooled(index)}
+        self._preferably_not = {(model.groups[group], model.persons[person])
+                                for group, person in zip(*(model.availability == PREFERABLY_NOT).nonzero())}
+        self._conflicts = defaultdict(list)
+        for group1, group2 in model.incompatible_names():
+            self._conflicts[group1].append(group2)
+            self._conflicts[group2].append(group1)
+        self._partners = defaultdict(list)
+        for group1, group2 in model.consecutive_names():
+            self._partners[group1].append(group2)
+            self._partners[group2].append(group1)
+
+    def _select_variable(self, domains, assignments):
+        """
+        the open group to assign next, or None if all groups are assigned
+        """
+        count = defaultdict(int)
+        for person in assignments.values():
+            count[person] += 1
+        best = None
+        best_key = None
+        for variable, domain in domains.items():
+            if variable in assignments:
+                continue
+            key = (len(domain),
+                   -sum(other not in assignments for other in self._conflicts[variable]),
+                   sum(self._n_shifts[person] - count[person] for person in domain))
+            if best_key is None or key < best_key:
+                best = variable
+                best_key = key
+        return best
+
+    def _order_values(self, variable, domain, assignments):
+        """
+        TAs of the domain of variable, the TA to try first last (the solver pops them from the end)
+        """
+        partners = [assignments[partner] for partner in self._partners[variable] if partner in assignments]
+
+        def preference(person):
+            consecutive = 0 if person in self._pooled else partners.count(person)
+            return consecutive, (variable, person) not in self._preferably_not
+        return sorted(domain[:], key=preference)
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        forwardcheck = self._forwardcheck
+        assignments = {}
+        queue = []
+
+        while True:
+            variable = self._select_variable(domains, assignments)
+            if variable is not None:
+                values = self._order_values(variable, domains[variable], assignments)
+                if forwardcheck:
+                    pushdomains = [domains[x] for x in domains if x not in assignments and x != variable]
+                else:
+                    pushdomains = None
+            else:
+                # all groups are assigned, go back to the last group if there is one
+                yield assignments.copy()
+                if not queue:
+                    return
+                variable, values, pushdomains = queue.pop()
+                if pushdomains:
+                    for domain in pushdomains:
+                        domain.popState()
+
+            while True:
+                if not values:
+                    # no TAs left, go back to the last group that has TAs left
+                    assignments.pop(variable, None)
+                    while queue:
+                        variable, values, pushdomains = queue.pop()
+                        if pushdomains:
+                            for domain in pushdomains:
+                                domain.popState()
+                        if values:
+                            break
+                        del assignments[variable]
+                    else:
+                        return
+
+                assignments[variable] = values.pop()
+                if pushdomains:
+                    for domain in pushdomains:
+                        domain.pushState()
+                for constraint, variables in vconstraints[variable]:
+                    if not constraint(variables, domains, assignments, pushdomains):
+                        break
+                else:
+                    break
+                if pushdomains:
+                    for domain in pushdomains:
+                        domain.popState()
+
+            queue.append((variable, values, pushdomains))
 
 
-def extract_solutions(df, all_solutions, consecutive_ratio):
+def create_problem(model, all_solutions, consecutive_ratio, progress=None, deadline=None):
     """
-    extract the solution
+    set up the CSP problem, returns None if it is clear beforehand that there are no solutions
     """
-    team = create_team_availability(df)
-
-    # extract important information from groups
-    incompatible_groups = extract_incompatible_combinations(df)
-    consecutive_groups, consecutive_inconvenient = extract_consecutive_combinations(df)
-    incompatible_inconvenient = incompatible_groups + consecutive_inconvenient
-    num_plus1shift = count_plus1shift(df)
-
-    domains = {}
-    for group in df["Group"]:
-        domain = []
-        for person in team.keys():
-            availability = team[person]['availability'].get(group, 'No') # just a sanity check to default to 'No'
-            if availability != 'No':
-                domain.append(person)
-        domains[group] = domain
+    domains = model.domains()
+    if not all(domains.values()):
+        return None  # a group without available TAs
 
     # set up the CSP problem
-    problem = Problem(OptimizedBacktrackingSolver())
+    problem = Problem(ScheduleSolver(model))
 
     # add domains
     domains = dict(sorted(domains.items(), key=lambda x: len(x[1])))
     for group in domains.keys():
         problem.addVariable(variable=group, domain=domains[group])
 
-    # add the custom constraints
-    group_list = list(domains.keys()) # alphabetical order
-    problem.addConstraint(FunctionConstraint(lambda *values:
-                                             custom_constraint(
-                                                 *values,
-                                                 list_of_groups=group_list,
-                                                 incompatible_combinations=incompatible_inconvenient,
-                                                 consecutive_groups= consecutive_groups,
-                                                 plus1shift= num_plus1shift,
-                                                 consecutive_ratio=consecutive_ratio,
-                                                 team_dict=team,
-                                                 all_solutions=all_solutions)
-                                             ), group_list)
+    # add the constraints
+    feasible = add_schedule_constraints(problem, domains, model,
+                                        consecutive_ratio=consecutive_ratio,
+                                        all_solutions=all_solutions,
+                                        progress=progress,
+                                        deadline=deadline)
+    if not feasible:
+        return None
+    return problem
+
+
+def extract_solutions(model, all_solutions, consecutive_ratio, stream=False, progress=None, deadline=None):
+    """
+    extract the solution
+    stream: if all solutions are required, return an iterator that finds the solutions one at a time
+    instead of a list of all solutions
+    progress: SearchProgress (see *progress.py*) that reports the progress of the search, if given
+    deadline: Deadline (see *deadline.py*), when it has passed only the solutions found so far are returned
+    """
+    problem = create_problem(model, all_solutions, consecutive_ratio, progress, deadline)
+    if problem is None:
+        return [] if all_solutions else None
+    if (progress is not None or deadline is not None) and all_solutions:
+        print("Finding solutions, please wait")
+        solutions = _report_solutions(problem.getSolutionIter(), progress)
+        return solutions if stream else list(solutions)
+    if deadline is not None:
+        print("Finding solution, please wait")
+        try:
+            solution = problem.getSolution()
+        except SearchStopped:
+            solution = None
+        if progress is not None:
+            progress.solutions = int(solution is not None)
+            progress.finish()
+        return solution
 
     # find solutions
-    if all_solutions:
+    if all_solutions and stream:
+        print("Finding solutions, please wait")
+        solutions = problem.getSolutionIter()
+    elif all_solutions:
         print("Finding solutions, please wait")
         solutions = problem.getSolutions()
     else: # find first solution
         print("Finding solution, please wait")
         solutions = problem.getSolution()
 
+    if progress is not None:
+        progress.solutions = len(solutions) if all_solutions else int(solutions is not None)
+        progress.finish()
     return solutions
 
 
+def _report_solutions(solutions, progress):
+    try:
+        for solution in solutions:
+            if progress is not None:
+                progress.solution()
+            yield solution
+    except SearchStopped:
+        pass  # the deadline has passed, end with the solutions so far
+    if progress is not None:
+        progress.finish()
+
+
+def extract_best_solution(model, progress=None, deadline=None):
+    """
+    extract the best solution with branch-and-bound. Gives a solution with the same
+    consecutive_shift_count and preferably_not_count as process_solutions on all solutions,
+    but skips every partial solution that can't beat the best solution found so far
+    progress: SearchProgress (see *progress.py*) that reports the progress of the search, if given
+    deadline: Deadline (see *deadline.py*), when it has passed the best solution so far is returned
+    """
+    print("Finding best solution, please wait")
+    return BranchAndBound(model, progress, deadline).solve()
+
+
+def extract_backjump_solution(model, all_solutions, consecutive_ratio, progress=None, deadline=None):
+    """
+    extract the best solution (if all solutions are searched), or the first solution with a ratio of consecutive
+    groups larger than consecutive_ratio, with conflict-directed backjumping and nogood learning (see *backjump.py*)
+    """
+    search = ConflictDirectedSearch(model, progress, deadline)
+    if all_solutions:
+        print("Finding best solution, please wait")
+        solution = search.solve()
+    else:
+        print("Finding solution, please wait")
+        solution = search.first_solution(consecutive_ratio)
+    print(f"{search.backjumps} backjumps, {search.learned} nogoods learned")
+    return solution
+
+
+def extract_preference_solution(model, deadline=None):
+    """
+    extract the solution with the least amount of 'Preferably Not' with minimum cost flow,
+    and report how far it can be from the best possible count
+    """
+    print("Finding solution with minimum cost flow, please wait")
+    solution, prefNot_count, lower_bound = optimize_preference(model, deadline=deadline)
+    if solution is not None:
+        print(f"'Preferably Not' count: {prefNot_count} (lower bound: {lower_bound}, gap: {prefNot_count - lower_bound})")
+    return solution
+
+
+def extract_lns_solution(model, time_limit=float(60), deadline=None):
+    """
+    extract a solution with large neighbourhood search. It starts from the minimum cost flow
+    solution (or the first CSP solution), and keeps improving it until time_limit (seconds),
+    or until the deadline (see *deadline.py*) if it has an end
+    """
+    print("Finding solution with large neighbourhood search, please wait")
+    if deadline is not None:
+        time_limit = deadline.remaining(default=time_limit)
+    initial = optimize_preference(model, deadline=deadline)[0]
+    if initial is None:
+        problem = create_problem(model, all_solutions=True, consecutive_ratio=None, deadline=deadline)
+        try:
+            initial = problem.getSolution() if problem is not None else None
+        except SearchStopped:
+            initial = None
+    if initial is None:
+        return None
+
+    search = LargeNeighbourhoodSearch(model)
+    solution, score = search.solve(initial, time_limit=time_limit, deadline=deadline)
+    print(f"Consecutive shifts: {score[0]}, 'Preferably Not' count: {score[1]} "
+          f"({search.improvements} improvements in {search.iterations} iterations)")
+    return solution
+
+
+### Functions to extract solutions on multiple cores ###
+def split_search(model, n_subproblems):
+    """
+    split the search tree on the values of the most constrained groups, until there are
+    at least n_subproblems partial solutions (dictionaries of group index -> TA index)
+    that don't break the number of shifts or the incompatible combinations
+    """
+    order = sorted(range(model.n_groups), key=lambda group: (len(model.domain(group)), -len(model.conflicts(group))))
+    partial_solutions = [{}]
+    for group in order:
+        if len(partial_solutions) >= n_subproblems:
+            break
+        conflicts = model.conflicts(group)
+        extended = []
+        for fixed in partial_solutions:
+            n_appointed = defaultdict(int)
+            for person in fixed.values():
+                n_appointed[person] += 1
+            for person in model.domain(group):
+                if n_appointed[person] >= model.n_shifts[person]:
+                    continue
+                if not model.is_pooled(person) and any(fixed.get(other) == person for other in conflicts):
+                    continue
+                extended.append({**fixed, group: person})
+        partial_solutions = extended
+    return partial_solutions
+
+
+_worker_model = None
+_worker_bound = None
+# value of the shared bound before any worker has found a schedule
+NO_SCORE = -2 ** 62
+
+
+def _init_worker(model, bound):
+    global _worker_model, _worker_bound
+    _worker_model = model
+    _worker_bound = bound
+    # Ctrl+C is handled by the main process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def score_key(score, n_groups):
+    """
+    score (consecutive_shift_count, preferably_not_count) as one number that ranks as process_solutions:
+    higher is better (the 'Preferably Not' count is at most n_groups)
+    """
+    return score[0] * (n_groups + 1) - score[1]
+
+
+class SharedBound:
+    """
+    search of a worker process that shares the score of its best schedule with the other workers through
+    a multiprocessing.Value (_worker_bound), and skips the subtrees that can't reach the best score of all workers.
+    Subtrees that can only tie with it are still searched, so the merged result is the same as without sharing
+    """
+    def _can_improve(self):
+        if not super()._can_improve():
+            return False
+        best = _worker_bound.value
+        if best == NO_SCORE:
+            return True
+        weight = self.model.n_groups + 1
+        return self._optimistic_consecutive() * weight - self._optimistic_preferably_not() >= best
+
+    def _record(self):
+        super()._record()
+        key = score_key(self.best_score, self.model.n_groups)
+        with _worker_bound.get_lock():
+            if key > _worker_bound.value:
+                _worker_bound.value = key
+
+
+class SharedBranchAndBound(SharedBound, BranchAndBound):
+    pass
+
+
+class SharedConflictDirectedSearch(SharedBound, ConflictDirectedSearch):
+    pass
+
+
+def _solve_subproblem(task):
+    """
+    solve the subtree below a partial solution in a worker process, returns the index of
+    the subproblem, the (best or first) solution, its score and whether the deadline stopped the search
+    """
+    index, fixed, all_solutions, consecutive_ratio, engine, end = task
+    model = _worker_model.fix(fixed)
+    deadline = Deadline(deadline=end) if end is not None else None
+    if engine == 'cbj' and all_solutions:
+        solution = SharedConflictDirectedSearch(model, deadline=deadline).solve()
+    elif engine == 'cbj':
+        solution = ConflictDirectedSearch(model, deadline=deadline).first_solution(consecutive_ratio)
+    elif all_solutions and engine == 'bnb':
+        solution = SharedBranchAndBound(model, deadline=deadline).solve()
+    else:
+        problem = create_problem(model, all_solutions, consecutive_ratio, deadline=deadline)
+        if problem is None:
+            solution = None
+        elif all_solutions:
+            solution = process_solutions(_report_solutions(problem.getSolutionIter(), None), model)
+        else:
+            try:
+                solution = problem.getSolution()
+            except SearchStopped:
+                solution = None
+    stopped = deadline is not None and deadline.stopped
+    if solution is None:
+        return index, None, None, stopped
+    return index, solution, score_solution(solution, model), stopped
+
+
+def extract_solutions_parallel(model, all_solutions, consecutive_ratio, engine='bnb', n_workers=None,
+                               deadline=None):
+    """
+    extract the solution with multiple worker processes, each searching a part of the search tree.
+    If all solutions are searched, the best solution of every part is merged with the same ranking
+    as process_solutions, and the 'bnb' and 'cbj' workers share the best score so far to skip more of
+    their parts (see SharedBound). Otherwise, the first worker that finds a solution cancels the others
+    deadline: Deadline (see *deadline.py*), when it has passed the best solution so far is returned
+    """
+    n_workers = n_workers or os.cpu_count()
+    # more subproblems than workers, so workers that finish early can take over
+    partial_solutions = split_search(model, 4 * n_workers)
+    end = deadline.end if deadline is not None else None
+    tasks = [(index, fixed, all_solutions, consecutive_ratio, engine, end)
+             for index, fixed in enumerate(partial_solutions)]
+
+    print(f"Finding {'solutions' if all_solutions else 'solution'} on {n_workers} cores, please wait")
+    best_key = None
+    best_solution = None
+    bound = multiprocessing.Value('q', NO_SCORE)
+    with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(model, bound)) as pool:
+        results = pool.imap_unordered(_solve_subproblem, tasks)
+        while True:
+            try:
+                # wait in short steps, so that the deadline and Ctrl+C are noticed
+                index, solution, score, stopped = results.next(timeout=0.2)
+            except multiprocessing.TimeoutError:
+                if deadline is not None and deadline.expired():
+                    deadline.stopped = True
+                    pool.terminate()  # stop the workers
+                    break
+                continue
+            except StopIteration:
+                break
+            if stopped and deadline is not None:
+                deadline.stopped = True
+            if solution is None:
+                continue
+            if not all_solutions:
+                pool.terminate()  # stop the other workers
+                return solution
+            # ties are won by the solution from the first part of the search tree
+            key = (score[0], -score[1], -index)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_solution = solution
+    return best_solution
+
+
 ### Further processing of solutions functions ###
-def count_consecutive(solutions, consecutive_groups):
+def score_solution(solution, model):
     """
-    count number of consecutive groups (same TA)
+    count number of consecutive groups (same TA) and number of non-preference groups in solution
     """
-    for solution in solutions:
-        consecutive_count = 0
-        for shift1, shift2 in consecutive_groups:
-            # check if both consecutive shifts are assigned to the same person in the solution
-            if solution.get(shift1) == solution.get(shift2):
-                consecutive_count += 1
+    consecutive_count = 0
+    for shift1, shift2 in model.consecutive:
+        # check if both consecutive shifts are assigned to the same person in the solution
+        person = solution.get(model.groups[shift1])
+        if person == solution.get(model.groups[shift2]) and not model.is_pooled(model.person_index[person]):
+            consecutive_count += 1
 
-        # Add the consecutive shift count to the solution
-        solution['consecutive_shift_count'] = consecutive_count
-    return solutions
+    prefNot_counter = 0
+    for group_index, group in enumerate(model.groups):
+        if model.is_preferably_not(group_index, model.person_index[solution[group]]):
+            prefNot_counter += 1
+    return consecutive_count, prefNot_counter
 
 
-def count_preference(solutions, team):
+def score_solutions(assignments, model):
     """
-    count number of non-preference groups in solution
+    consecutive_shift_count and preferably_not_count of every row of a matrix (solutions x groups) of TA indices
     """
-    for solution in solutions:
-        prefNot_counter = 0
-        for group, person in solution.items():
-                if team[person]['availability'].get(group) == 'Preferably Not':
-                    # delete the availability from solution
-                    prefNot_counter += 1
-        solution['preferably_not_count'] = prefNot_counter
-    return solutions
+    return model.consecutive_counts(assignments), model.preferably_not_counts(assignments)
+
+
+def rank_solutions(assignments, model, top_k=None):
+    """
+    indices of the rows of a matrix (solutions x groups) of TA indices, from the best to the worst solution
+    (only the top_k best if given), ranked as process_solutions
+    """
+    consecutive_counts, prefNot_counts = score_solutions(assignments, model)
+    # the last key is sorted on first: most consecutive shifts, then least 'Preferably Not', then first found
+    order = np.lexsort((np.arange(len(consecutive_counts)), prefNot_counts, -consecutive_counts))
+    return order if top_k is None else order[:top_k]
 
 
-def process_solutions(solutions, df):
+def process_solutions(solutions, model, top_k=None, batch_size=SCORE_BATCH_SIZE):
     """
     Further processes the solutions in case there are multiple solutions.
     Best solution is selected by first picking the one with the most
     consecutive shifts (for a TA). If there are still more than 1 left,
     out of these, it picks the one with the least amount of 'Preferably Not'
-    """
-    team = create_team_availability(df)
-    consecutive_groups = extract_consecutive_combinations(df)[0]
-
-    # count number of consecutive groups and number of 'Preferably Not'
-    solutions = count_consecutive(solutions, consecutive_groups)
-    solutions = count_preference(solutions, team)
-
-    # extract list of solutions with max count of consecutive shifts
-    max_count = max(sol['consecutive_shift_count'] for sol in solutions)
-    solutions_with_most_consecutive = [sol for sol in solutions if sol['consecutive_shift_count'] == max_count]
 
-    # from this list, pick the solution with least 'Preferably Not' count
-    best_solution = min(solutions_with_most_consecutive, key=lambda sol: sol['preferably_not_count'])
-    return best_solution
+    solutions can be a matrix (solutions x groups) of TA indices, or dictionaries of group name -> TA name,
+    also from an iterator (see extract_solutions with stream=True). Dictionaries are converted to TA indices
+    and scored batch_size at a time with numpy (see rank_solutions), and only the top_k best are kept.
+    Returns the best solution, or a list of the top_k best solutions (best first) if top_k is given.
+    """
+    k = 1 if top_k is None else top_k
+    if isinstance(solutions, np.ndarray):
+        best = solutions[rank_solutions(solutions, model, k)]
+    else:
+        best = np.empty((0, model.n_groups), dtype=np.int64)
+        person_index = model.person_index
+        groups = model.groups
+        solutions = iter(solutions)
+        while True:
+            batch = [[person_index[solution[group]] for group in groups]
+                     for solution in itertools.islice(solutions, batch_size)]
+            if not batch:
+                break
+            # the best solutions so far come first, so they win ties with the solutions of this batch
+            candidates = np.concatenate([best, np.array(batch, dtype=np.int64)])
+            best = candidates[rank_solutions(candidates, model, k)]
+
+    ranked_solutions = []
+    consecutive_counts, prefNot_counts = score_solutions(best, model)
+    for assignment, consecutive_count, prefNot_count in zip(best, consecutive_counts, prefNot_counts):
+        solution = model.to_names(assignment)
+        solution['consecutive_shift_count'] = int(consecutive_count)
+        solution['preferably_not_count'] = int(prefNot_count)
+        ranked_solutions.append(solution)
+
+    if top_k is None:
+        return ranked_solutions[0] if ranked_solutions else None
+    return ranked_solutions
 
 
 ##### REDUCE DIMENSIONS FUNCTIONS ######
@@ -436,66 +1309,57 @@ def decrease_preferably_not(df, min_availability_ratio = float(0.4)):
     Set minimal ratio of availability to total amount of groups for employee.
     Lower settings significantly reduce the time to solve the problem
     but may result in finding suboptimal or no results (default = 0.4).
+    A "Preferably Not" of a TA is set to "No" for a group that has at least 2 "Yes" and 3 "Yes" or "Preferably Not",
+    if the TA says "Yes" to more than min_availability_ratio of the groups.
+    Returns the dataframe and a report (dataframe) of the changed cells
     """
-
     columns_to_compare = df.columns[5:]
     n_groups = df.shape[0]
+    values = df[columns_to_compare].to_numpy(dtype=object)
+    yes = values == 'Yes'
+    preferably_not = values == 'Preferably Not'
+    preferably_not_before = int(preferably_not.sum())
 
-    availability = {}
-    for column in columns_to_compare:
-        count = pd.Series(df[column]).value_counts().to_frame()
-        available_count = count.loc["Yes", "count"]
-        availability[column] = available_count
-
-    preferably_not_before = df.apply(lambda col: pd.Series(col).value_counts()).T
-    preferably_not_before = int(preferably_not_before["Preferably Not"].sum())
+    # running counters per group and per TA. Setting a "Preferably Not" to "No" never changes the "Yes" counts, and
+    # a group with at least 2 "Yes" keeps 3 "Yes" or "Preferably Not" as long as it has a "Preferably Not" to change,
+    # so the rules can be checked for all cells at once
+    y_count = yes.sum(axis=1)
+    pn_count = preferably_not.sum(axis=1)
+    availability = yes.sum(axis=0)
 
-    dfT= df.T
-    for i, row in df.iloc[:,5:].iterrows():
+    crowded_groups = (y_count + pn_count >= 3) & (y_count >= 2)
+    available_persons = availability / n_groups > min_availability_ratio
+    change = preferably_not & crowded_groups[:, None] & available_persons[None, :]
 
-        pn_count = (dfT.loc[:,i] == 'Preferably Not').sum()
-        y_count = (dfT.loc[:,i] == 'Yes').sum()
+    rows, columns = np.nonzero(change)
+    for column in np.unique(columns):
+        df.loc[df.index[rows[columns == column]], columns_to_compare[column]] = 'No'
+    pn_count -= change.sum(axis=1)
 
-        if y_count + pn_count >= 3 and y_count >=2:
-            dfT_pn = dfT.loc[dfT[i] == 'Preferably Not']
+    report = pd.DataFrame({"Group": df["Group"].to_numpy()[rows],
+                           "TA": columns_to_compare[columns],
+                           "Before": 'Preferably Not',
+                           "After": 'No'})
+    print(f"Preferably Not count decreased from {preferably_not_before} to {int(pn_count.sum())}")
 
-            if dfT_pn.shape[0] >= 1:
-                for j, personT in dfT_pn.iterrows():
-                    if availability[j]/n_groups > min_availability_ratio and (y_count + pn_count >= 3 and y_count >=2):
-                        #print(f"{j}'s Preferably Not set to No for group {df.iloc[i,2]}")
-                        df.at[i, j] = 'No'
-
-                        pn_count = (dfT.loc[:, i] == 'Preferably Not').sum()
-                        y_count = (dfT.loc[:, i] == 'Yes').sum()
-
-    preferably_not_after = df.apply(lambda col: pd.Series(col).value_counts()).T
-    preferably_not_after = int(preferably_not_after["Preferably Not"].sum())
-    print(f"Preferably Not count decreased from {preferably_not_before} to {preferably_not_after}")
-
-    return df
+    return df, report
 
 
 def calculate_similarity_scores(dataframe, columns):
     """
     calculate similarity scores between each unique pair of TAs
     """
-    binary_df = dataframe[columns].copy()
-
-    # preprocess dataframe
-    binary_df = binary_df.replace({'No': 0, np.nan: 0, 'Preferably Not': 1, 'Yes': 1}).astype(int)
+    # percentage of matching (not) available groups for all pairs at once, see *merging.py*
+    similarity = similarity_matrix(availability_codes(dataframe, list(columns)))
 
     # initialize a dictionary to store similarity scores
     similarity_scores = {}
 
-    for col1, col2 in itertools.combinations(columns, 2):
-        # calculate the percentage of matching values
+    for (i, col1), (j, col2) in itertools.combinations(enumerate(columns), 2):
         if '-' in col1 or '-' in col2:
             continue
         else:
-            matches = (binary_df[col1] == binary_df[col2]).sum()  # count matches
-            total_rows = len(binary_df)  # total number of rows
-            similarity_percentage = matches / total_rows  # calculate percentage
-            similarity_scores[(col1, col2)] = similarity_percentage
+            similarity_scores[(col1, col2)] = similarity[i, j]
 
     return similarity_scores
 
@@ -0,0 +1,279 @@
+from collections import defaultdict
+from model import PREFERABLY_NOT
+from deadline import SearchStopped
+
+'''
+    Branch-and-bound search for the best schedule.
+
+    Instead of enumerating every solution and ranking them afterwards (see process_solutions in
+    *scheduler.py*), this search keeps the best schedule found so far (the incumbent) and skips
+    every part of the search tree that can't beat it. Schedules are ranked in the same way:
+    first by the most consecutive shifts (for a TA), then by the least amount of 'Preferably Not'.
+
+    While searching, appointing a TA to a group removes that TA from the groups that can't be
+    combined with it, and from all open groups once their shifts are filled (forward checking).
+    The next group is the open group with the fewest TAs left, and its TAs are tried best first
+    (consecutive pairs, then 'Yes' before 'Preferably Not'), so good schedules are found early.
+'''
+
+
+class BranchAndBound:
+    """
+    branch-and-bound search over the groups (variables) and TAs (values) of a ScheduleModel,
+    groups and TAs are referred to by their index in the model
+    """
+    def __init__(self, model, progress=None, deadline=None, max_nodes=None):
+        """
+        progress: SearchProgress (see *progress.py*) that receives every node of the search, if given
+        deadline: Deadline (see *deadline.py*), when it has passed the best schedule so far is returned
+        max_nodes: number of nodes after which the best schedule so far is returned (None: no limit), which,
+        unlike a deadline, gives the same schedule on every machine
+        """
+        self.model = model
+        self.progress = progress
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.n_shifts = model.n_shifts.tolist()
+        self.preferably_not = {(int(group), int(person))
+                               for group, person in zip(*(model.availability == PREFERABLY_NOT).nonzero())}
+
+        self.conflicts = defaultdict(set)
+        for group1, group2 in model.incompatible:
+            self.conflicts[group1].add(group2)
+            self.conflicts[group2].add(group1)
+
+        self.consecutive_groups = sorted(model.consecutive)
+        self.partners = defaultdict(list)
+        for group1, group2 in self.consecutive_groups:
+            self.partners[group1].append(group2)
+            self.partners[group2].append(group1)
+
+        # initially most constrained groups first, ties broken by the number of conflicts
+        self.values = {group: model.domain(group) for group in range(model.n_groups)}
+        self.order = sorted(self.values, key=lambda group: (len(self.values[group]), -len(self.conflicts[group])))
+        self.assignments = None  # set by _reset
+
+    def solve(self, incumbent_score=None):
+        """
+        run the search, returns the best schedule (dictionary of group name -> TA name) or None if
+        there is no schedule at all.
+        incumbent_score: score (consecutive_shift_count, preferably_not_count) of a known schedule,
+        only schedules that are better are searched for (None if there is no better schedule)
+        """
+        if not self._reset(incumbent_score):
+            return None
+        try:
+            self._search(0)
+        except SearchStopped:
+            pass  # keep the best schedule so far
+        if self.progress is not None:
+            self.progress.finish()
+        if self.best is None:
+            return None
+        return self.model.to_names([self.best[group] for group in range(self.model.n_groups)])
+
+    def _reset(self, incumbent_score=None):
+        """
+        start with an empty schedule, returns False if the TAs can't get their number of shifts at all
+        """
+        self.domains = {group: set(values) for group, values in self.values.items()}
+        self.assignments = {}
+        self.count = defaultdict(int)
+        self.support = defaultdict(int)
+        for values in self.domains.values():
+            for person in values:
+                self.support[person] += 1
+
+        self.consecutive_count = 0
+        self.preferably_not_count = 0
+        self.best = None
+        self.best_score = incumbent_score
+        self.nodes = 0  # number of (partial) schedules visited
+        return self._capacity_ok(range(self.model.n_persons))
+
+    def score(self):
+        """
+        score of the best schedule: (consecutive_shift_count, preferably_not_count)
+        """
+        return self.best_score
+
+    def assignment_bounds(self, group, person):
+        """
+        bounds of the schedules in which group gets person: the most consecutive pairs and the fewest
+        'Preferably Not' they can have, as the search computes them (see _can_improve), or None if forward
+        checking already shows that there is no such schedule. Starts from the empty schedule, so a search that
+        was stopped halfway is reset (and forgets its best schedule)
+        """
+        if self.assignments is None or self.assignments:
+            self.feasible = self._reset()
+        if not self.feasible:
+            return None
+        trail = []
+        bounds = None
+        if self._assign(group, person, trail):
+            bounds = self._optimistic_consecutive(), self._optimistic_preferably_not()
+        self._unassign(group, person, trail)
+        return bounds
+
+    ### bounds ###
+    def _optimistic_consecutive(self):
+        """
+        number of consecutive pairs that are, or can still become, appointed to the same TA
+        """
+        count = self.consecutive_count
+        assignments = self.assignments
+        domains = self.domains
+        for group1, group2 in self.consecutive_groups:
+            if group1 in assignments:
+                if group2 not in assignments and assignments[group1] in domains[group2]:
+                    count += 1
+            elif group2 in assignments:
+                if assignments[group2] in domains[group1]:
+                    count += 1
+            elif not domains[group1].isdisjoint(domains[group2]):
+                count += 1
+        return count
+
+    def _optimistic_preferably_not(self):
+        """
+        number of 'Preferably Not' so far, plus 1 for each open group without a 'Yes' TA left
+        """
+        count = self.preferably_not_count
+        for group in self.order:
+            if group not in self.assignments:
+                if all((group, person) in self.preferably_not for person in self.domains[group]):
+                    count += 1
+        return count
+
+    def _can_improve(self):
+        """
+        check whether the subtree below the current partial schedule can beat the incumbent
+        """
+        if self.best_score is None:
+            return True
+        best_consecutive, best_preferably_not = self.best_score
+        consecutive_bound = self._optimistic_consecutive()
+        if consecutive_bound != best_consecutive:
+            return consecutive_bound > best_consecutive
+        return self._optimistic_preferably_not() < best_preferably_not
+
+    ### search ###
+    def _search(self, depth):
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchStopped()
+        if depth == len(self.order):
+            self._record()
+            return
+
+        if not self._can_improve():
+            return
+
+        group = self._select_group()
+        values = self._order_values(group)
+        n_values = len(values)
+        for person in values:
+            if self.progress is not None:
+                self.progress.node(depth, n_values)
+            trail = []
+            if self._assign(group, person, trail):
+                self._search(depth + 1)
+            self._unassign(group, person, trail)
+
+    def _record(self):
+        """
+        keep the current (complete) schedule if it beats the best schedule so far
+        """
+        if self.progress is not None:
+            self.progress.solution()
+        score = (self.consecutive_count, self.preferably_not_count)
+        if self.best_score is None or (score[0], -score[1]) > (self.best_score[0], -self.best_score[1]):
+            self.best = dict(self.assignments)
+            self.best_score = score
+
+    def _select_group(self):
+        """
+        open group with the fewest TAs left, ties broken by the most open incompatible groups
+        and then by the fewest shifts left of its TAs
+        """
+        best = None
+        best_key = None
+        for group in self.order:
+            if group in self.assignments:
+                continue
+            domain = self.domains[group]
+            key = (len(domain),
+                   -sum(other not in self.assignments for other in self.conflicts[group]),
+                   sum(self.n_shifts[person] - self.count[person] for person in domain))
+            if best_key is None or key < best_key:
+                best = group
+                best_key = key
+        return best
+
+    def _order_values(self, group):
+        """
+        TAs left for group, first those that make a consecutive pair, then 'Yes' before 'Preferably Not'
+        """
+        return sorted(self.domains[group],
+                      key=lambda person: (-self._consecutive_with(group, person),
+                                          (group, person) in self.preferably_not, person))
+
+    def _assign(self, group, person, trail):
+        """
+        appoint person to group and forward check the open groups. Removed values are
+        recorded in trail so they can be restored, returns False on a dead end
+        """
+        self.assignments[group] = person
+        self.count[person] += 1
+        for value in self.domains[group]:
+            self.support[value] -= 1
+        self.consecutive_count += self._consecutive_with(group, person)
+        self.preferably_not_count += (group, person) in self.preferably_not
+
+        touched = set(self.domains[group])
+        if self.count[person] == self.n_shifts[person]:
+            neighbours = [other for other in self.order if other not in self.assignments]
+        elif self.model.is_pooled(person):
+            neighbours = []  # stands for several TAs, so it can take incompatible groups
+        else:
+            neighbours = [other for other in self.conflicts[group] if other not in self.assignments]
+        for other in neighbours:
+            if person in self.domains[other]:
+                self.domains[other].discard(person)
+                self.support[person] -= 1
+                trail.append(other)
+                if not self.domains[other]:
+                    return False
+        touched.add(person)
+        return self._capacity_ok(touched)
+
+    def _consecutive_with(self, group, person):
+        """
+        number of consecutive groups of group that are appointed to the same (not pooled) TA
+        """
+        if self.model.is_pooled(person):
+            return 0
+        return sum(self.assignments.get(partner) == person for partner in self.partners[group])
+
+    def _unassign(self, group, person, trail):
+        for other in trail:
+            self.domains[other].add(person)
+            self.support[person] += 1
+        self.preferably_not_count -= (group, person) in self.preferably_not
+        self.consecutive_count -= self._consecutive_with(group, person)
+        for value in self.domains[group]:
+            self.support[value] += 1
+        self.count[person] -= 1
+        del self.assignments[group]
+
+    def _capacity_ok(self, persons):
+        """
+        check whether every TA in persons can still get exactly their number of shifts
+        """
+        for person in persons:
+            n_shifts = self.n_shifts[person]
+            if self.count[person] > n_shifts or self.count[person] + self.support[person] < n_shifts:
+                return False
+        return True
@@ -0,0 +1,373 @@
+import io
+import os
+import sys
+import json
+import signal
+import time
+import asyncio
+import argparse
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from scheduler import generate_schedule
+from workbooks import read_availability
+from batch import job_parameters
+from cache import MemoryCache, DEFAULT_MAX_BYTES
+from deadline import Deadline
+
+'''
+    Local scheduling service: a long-running process that takes scheduling jobs over HTTP, so the interpreter,
+    pandas and python-constraint are loaded once, and parsed workbooks, preprocessed models and solutions stay
+    in memory between jobs.
+
+        python service.py --port 8765
+        python service.py --socket /tmp/schedules.sock --workers 2
+
+    The service only listens on localhost (or on a Unix socket). A job is a workbook (or .csv, .parquet, .arrow
+    file, see *workbooks.py*) on this machine with any parameters of generate_schedule (see *scheduler.py*),
+    as for a manifest of *batch.py*: TAs can only be merged automatically and the suffix defaults to the name
+    of the workbook. Relative paths are relative to the directory the service was started in.
+
+        POST   /jobs                 {"path": "statistics_1a.xlsx", "engine": "cbj", "time_limit": 600}
+        GET    /jobs                 all jobs
+        GET    /jobs/<id>            status of a job, with its last progress report
+        GET    /jobs/<id>/progress   progress reports and status changes as JSON lines, until the job is done
+        GET    /jobs/<id>/schedule   the schedule of a finished job
+        DELETE /jobs/<id>            cancel a job: a queued job doesn't run, a running search is stopped
+
+    e.g. curl -X POST localhost:8765/jobs -d '{"path": "availability/statistics_1a.xlsx"}'
+
+    Jobs run in a pool of worker threads of the service, so they all share one MemoryCache (see *cache.py*):
+    a job for a workbook and parameters that were scheduled before skips the preprocessing and the search.
+    The search is Python code, so jobs that run at the same time share a core; with more than one worker a
+    short job doesn't wait for a long one. Every schedule is written to output/ of the output directory
+    together with the log of its job, as in *batch.py*. Stop the service with Ctrl+C.
+'''
+
+# parsed workbooks that are kept in memory
+MAX_WORKBOOKS = 64
+# finished jobs that are kept, the oldest are forgotten
+MAX_JOBS = 1000
+# seconds between checks for new progress reports of a streamed job
+STREAM_INTERVAL = 0.5
+
+FINISHED = ('done', 'failed', 'cancelled')
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 500: 'Internal Server Error'}
+
+
+class ThreadOutput(io.TextIOBase):
+    """
+    replacement of sys.stdout that writes what a job prints to the log of the job, and all other output to stream
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        log = getattr(self.local, 'log', None)
+        return (self.stream if log is None else log).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class Job:
+    """
+    a workbook with the parameters of generate_schedule, and its status: 'queued', 'running', 'done',
+    'failed' or 'cancelled'
+    """
+    def __init__(self, job_id, workbook, parameters):
+        self.id = job_id
+        self.workbook = workbook
+        self.parameters = parameters
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.optimal = None
+        self.message = ""
+        self.schedule = None
+        self.log = io.StringIO()
+        self.events = []  # progress reports and status changes, streamed to clients
+        self.deadline = Deadline(time_limit=parameters.get('time_limit'))
+        self.cancelled = False
+        self.future = None
+        self.set_status('queued')
+
+    def set_status(self, status):
+        self.status = status
+        self.events.append({"event": "status", "status": status, "time": round(time.time(), 3)})
+
+    def progress(self, snapshot):
+        """
+        progress callback of generate_schedule (see *progress.py*)
+        """
+        self.events.append({"event": "progress", **snapshot})
+
+    def summary(self):
+        """
+        dictionary with the status of the job and its last progress report
+        """
+        progress = next((event for event in reversed(self.events) if event["event"] == "progress"), None)
+        end = self.finished if self.finished is not None else time.time()
+        return {"id": self.id, "workbook": self.workbook, "suffix": self.parameters['suffix'],
+                "status": self.status, "optimal": self.optimal, "message": self.message,
+                "seconds": None if self.started is None else round(end - self.started, 2),
+                "progress": progress}
+
+
+class SchedulingService:
+    """
+    queue of jobs that are run by n_workers threads, with a cache of cache_bytes in memory for all jobs
+    """
+    def __init__(self, n_workers=1, cache_bytes=DEFAULT_MAX_BYTES, root=None):
+        self.root = root or os.getcwd()
+        self.cache = MemoryCache(cache_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='job')
+        self.output = None
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+        self.workbooks = OrderedDict()  # (path, sheet, size, mtime) -> dataframe, least recently used first
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        route the output of jobs to their logs (the output of the service itself still goes to stdout)
+        """
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        self.output = sys.stdout
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            if job.status not in FINISHED:
+                self.cancel(job)
+        self.executor.shutdown(wait=True)
+
+    ### jobs ###
+    def submit(self, request):
+        """
+        queue a job for a request (dictionary with the path of the workbook and parameters), returns the job.
+        Raises ValueError for a request without a path or with unknown parameters
+        """
+        request = dict(request)
+        if 'path' not in request:
+            raise ValueError("a job needs the path of a workbook")
+        workbook = os.path.join(self.root, str(request.pop('path')))
+        parameters = job_parameters(workbook, request, {})
+        job = Job(next(self.ids), workbook, parameters)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._forget_jobs()
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def cancel(self, job):
+        job.cancelled = True
+        if job.future is not None and job.future.cancel():
+            job.finished = time.time()
+            job.set_status('cancelled')
+        else:
+            job.deadline.cancel()
+
+    def _forget_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(len(self.jobs) - MAX_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def _run(self, job):
+        """
+        run a job in a worker thread
+        """
+        job.started = time.time()
+        job.set_status('running')
+        if self.output is not None:
+            self.output.local.log = job.log
+        parameters = dict(job.parameters)
+        try:
+            df = self._read(job.workbook, parameters.pop('sheet', 0))
+            schedule = generate_schedule(df, **parameters, n_workers=1, cache=self.cache,
+                                         progress=job.progress, deadline=job.deadline)
+            job.schedule = schedule
+            job.optimal = bool(schedule.attrs.get("optimal"))
+            status = 'cancelled' if job.cancelled else 'done'
+        except SystemExit as error:
+            job.message = str(error.code)
+            status = 'cancelled' if job.cancelled else 'failed'
+        except Exception as error:
+            job.message = f"{type(error).__name__}: {error}"
+            status = 'failed'
+        finally:
+            if self.output is not None:
+                self.output.local.log = None
+        job.finished = time.time()
+        self._write_log(job)
+        job.set_status(status)
+
+    def _read(self, path, sheet):
+        """
+        dataframe of a workbook, kept in memory until the workbook changes
+        """
+        status = os.stat(path)
+        key = (path, sheet, status.st_size, status.st_mtime_ns)
+        with self.lock:
+            df = self.workbooks.get(key)
+            if df is not None:
+                self.workbooks.move_to_end(key)
+                return df.copy()
+        df = read_availability(path, sheet_name=sheet)
+        with self.lock:
+            self.workbooks[key] = df
+            while len(self.workbooks) > MAX_WORKBOOKS:
+                self.workbooks.popitem(last=False)
+        return df.copy()
+
+    def _write_log(self, job):
+        os.makedirs('output', exist_ok=True)
+        with open(os.path.join('output', f'log_{job.parameters["suffix"]}.txt'), 'w') as file:
+            file.write(job.log.getvalue())
+            if job.message:
+                file.write(f'{job.message}\n')
+
+    ### HTTP ###
+    async def handle(self, reader, writer):
+        """
+        answer one HTTP request, the connection is closed afterwards
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) != 3:
+                await respond(writer, 400, {"error": "malformed request"})
+                return
+            method, target, _ = request_line
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            await self.route(writer, method, urlsplit(target).path.rstrip('/'), body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as error:
+            await respond(writer, 500, {"error": f"{type(error).__name__}: {error}"})
+        finally:
+            writer.close()
+
+    async def route(self, writer, method, path, body):
+        parts = path.strip('/').split('/')
+        if parts[0] != 'jobs' or len(parts) > 3:
+            return await respond(writer, 404, {"error": f"unknown path {path}"})
+        if len(parts) == 1:
+            if method == 'GET':
+                return await respond(writer, 200, [job.summary() for job in list(self.jobs.values())])
+            if method != 'POST':
+                return await respond(writer, 405, {"error": "use GET or POST on /jobs"})
+            try:
+                job = self.submit(json.loads(body or b'{}'))
+            except (ValueError, TypeError, AttributeError) as error:
+                return await respond(writer, 400, {"error": str(error)})
+            return await respond(writer, 201, job.summary())
+
+        job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            return await respond(writer, 404, {"error": f"no job {parts[1]}"})
+        action = parts[2] if len(parts) == 3 else None
+        if action is None and method == 'GET':
+            return await respond(writer, 200, job.summary())
+        if action is None and method == 'DELETE':
+            self.cancel(job)
+            return await respond(writer, 200, job.summary())
+        if action == 'progress' and method == 'GET':
+            return await self.stream(writer, job)
+        if action == 'schedule' and method == 'GET':
+            if job.schedule is None:
+                return await respond(writer, 409, {"error": f"job {job.id} has no schedule", **job.summary()})
+            records = json.loads(job.schedule.to_json(orient='records'))
+            return await respond(writer, 200, {"optimal": job.optimal, "schedule": records})
+        return await respond(writer, 405 if action in (None, 'progress', 'schedule') else 404,
+                             {"error": f"{method} {path} is not supported"})
+
+    async def stream(self, writer, job):
+        """
+        send the events of a job as JSON lines while they happen, and its summary when it is finished
+        """
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n')
+        sent = 0
+        while True:
+            finished = job.status in FINISHED
+            events = job.events[sent:]
+            sent += len(events)
+            writer.write(b''.join(json.dumps(event).encode() + b'\n' for event in events))
+            await writer.drain()
+            if finished:
+                break
+            await asyncio.sleep(STREAM_INTERVAL)
+        writer.write(json.dumps({"event": "summary", **job.summary()}).encode() + b'\n')
+        await writer.drain()
+
+
+async def respond(writer, status, content):
+    body = json.dumps(content).encode()
+    writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+
+
+async def serve(service, host='127.0.0.1', port=8765, socket_path=None):
+    """
+    run the service on host:port, or on the Unix socket socket_path, until it is stopped
+    """
+    if socket_path is not None:
+        server = await asyncio.start_unix_server(service.handle, path=socket_path)
+        address = socket_path
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        address = f'http://{host}:{port}'
+    # stop on Ctrl+C and on SIGTERM (on Windows Ctrl+C raises KeyboardInterrupt in main instead)
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    print(f'Scheduling service listening on {address}')
+    async with server:
+        await stop.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="local scheduling service")
+    parser.add_argument('--port', type=int, default=8765, help="port on localhost (default: 8765)")
+    parser.add_argument('--socket', help="listen on this Unix socket instead of a port")
+    parser.add_argument('--workers', type=int, default=1, help="number of jobs that run at the same time")
+    parser.add_argument('--output-dir', default='.', help="schedules are written to output/ of this directory")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2,
+                        help="memory for preprocessed models and solutions (default: 256)")
+    args = parser.parse_args(argv)
+
+    service = SchedulingService(args.workers, int(args.cache_mb * 1024 ** 2), root=os.getcwd())
+    socket_path = None if args.socket is None else os.path.abspath(args.socket)
+    os.makedirs(args.output_dir, exist_ok=True)
+    # generate_schedule writes to output/ of the current directory
+    os.chdir(args.output_dir)
+    service.start()
+    try:
+        asyncio.run(serve(service, port=args.port, socket_path=socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('Stopping the scheduling service')
+        service.shutdown()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import copy
+import numpy as np
+from collections import defaultdict
+
+'''
+    Lossless symmetry reduction for interchangeable TAs.
+
+    TAs with 1 shift and exactly the same availability are interchangeable: swapping them in a schedule
+    gives another schedule with the same score, so the search would find every schedule once for every
+    order of these TAs. Instead, they are pooled into one TA with 1 shift per member, and after solving
+    the groups of the pooled TA are divided over its members again.
+
+    This doesn't lose any schedule: a TA with 1 shift can't get two incompatible groups or two consecutive
+    groups, so the pooled TA can take any combination of groups (see pool_size in *model.py*).
+    TAs with more shifts are not pooled, because how their groups are divided changes the schedule.
+'''
+
+
+def pool_interchangeable(model):
+    """
+    pool TAs with 1 shift and identical availability, returns the pooled model and a dictionary
+    of pooled TA -> names of its members (empty if there is nothing to pool). A pooled TA is the tuple of
+    the names of its members, so it can never be mistaken for a TA name (which is a string)
+    """
+    members = defaultdict(list)
+    for person in range(model.n_persons):
+        if model.n_shifts[person] == 1 and not model.is_pooled(person):
+            members[model.availability[:, person].tobytes()].append(person)
+
+    pooled_members = {}
+    for persons in members.values():
+        if len(persons) > 1:
+            pooled_members[persons[0]] = persons
+    if not pooled_members:
+        return model, {}
+
+    persons, n_shifts, pool_size, columns = [], [], [], []
+    pools = {}
+    dropped = {person for group in pooled_members.values() for person in group[1:]}
+    for person in range(model.n_persons):
+        if person in dropped:
+            continue
+        if person in pooled_members:
+            names = [model.persons[member] for member in pooled_members[person]]
+            pools[tuple(names)] = names
+            persons.append(tuple(names))
+            n_shifts.append(len(names))
+            pool_size.append(len(names))
+        else:
+            persons.append(model.persons[person])
+            n_shifts.append(int(model.n_shifts[person]))
+            pool_size.append(int(model.pool_size[person]))
+        columns.append(person)
+
+    pooled = copy.copy(model)
+    pooled.persons = persons
+    pooled.person_index = {person: i for i, person in enumerate(persons)}
+    pooled.n_shifts = np.asarray(n_shifts, dtype=np.int64)
+    pooled.pool_size = np.asarray(pool_size, dtype=np.int64)
+    pooled.availability = model.availability[:, columns].copy()
+    return pooled, pools
+
+
+def split_pooled(solution, pools):
+    """
+    divide the groups of every pooled TA in solution (dictionary of group name -> TA name) over its members
+    """
+    if not pools:
+        return solution
+    solution = dict(solution)
+    next_member = defaultdict(int)
+    for group, person in solution.items():
+        if person in pools:
+            solution[group] = pools[person][next_member[person]]
+            next_member[person] += 1
+    return solution
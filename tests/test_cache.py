@@ -0,0 +1,124 @@
+import os
+import time
+import numpy as np
+import scheduler
+from cache import ScheduleCache, MemoryCache, dataframe_key, derived_key
+from benchmark.generator import generate_instance
+
+'''
+    The caches of *cache.py*: hits and misses of both caches, least recently used eviction, keys of dataframes,
+    and the schedule cache of generate_schedule (a rerun with the same parameters skips the search).
+'''
+
+
+def test_disk_cache_hit_and_miss(tmp_path):
+    cache = ScheduleCache(str(tmp_path))
+    assert cache.get('missing') is None
+    cache.put('key', {"schedule": [1, 2, 3]})
+    assert cache.get('key') == {"schedule": [1, 2, 3]}
+    assert ScheduleCache(str(tmp_path)).get('key') == {"schedule": [1, 2, 3]}
+
+
+def test_disk_cache_damaged_entry_is_a_miss(tmp_path):
+    cache = ScheduleCache(str(tmp_path))
+    cache.put('key', 1)
+    with open(cache._path('key'), 'wb') as file:
+        file.write(b'not a cache entry')
+    assert cache.get('key') is None
+
+
+def test_disk_cache_removed_entry_is_a_miss(tmp_path, monkeypatch):
+    cache = ScheduleCache(str(tmp_path))
+    cache.put('key', 1)
+
+    def removed(path, *args, **kwargs):
+        raise FileNotFoundError(path)  # another run evicted the entry after it was read
+
+    monkeypatch.setattr(os, 'utime', removed)
+    assert cache.get('key') is None
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = ScheduleCache(str(tmp_path), max_bytes=2500)
+    data = np.random.default_rng(0).bytes(1000)  # doesn't compress
+    cache.put('old', data)
+    cache.put('used', data)
+    os.utime(cache._path('old'), (time.time() - 20, time.time() - 20))
+    os.utime(cache._path('used'), (time.time() - 10, time.time() - 10))
+    assert cache.get('used') == data  # marks it as recently used
+    cache.put('new', data)
+    assert cache.get('old') is None
+    assert cache.get('used') == data
+    assert cache.get('new') == data
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_bytes=2500)
+    assert cache.get('missing') is None
+    value = {"schedule": [1, 2, 3]}
+    cache.put('key', value)
+    value["schedule"].append(4)
+    assert cache.get('key') == {"schedule": [1, 2, 3]}  # a copy, not the object itself
+
+    data = bytes(1000)
+    cache.put('old', data)
+    cache.put('used', data)
+    cache.get('old')
+    cache.put('new', data)
+    assert cache.get('used') is None
+    assert cache.get('old') == data
+
+
+def test_dataframe_key():
+    df = generate_instance(8, 4, seed=0)
+    assert dataframe_key(df) == dataframe_key(df.copy())
+    assert dataframe_key(df) != dataframe_key(df, engine='bnb')
+    assert dataframe_key(df, engine='bnb') != dataframe_key(df, engine='cbj')
+    assert derived_key(dataframe_key(df), merge='auto') != derived_key(dataframe_key(df), merge=None)
+
+    # 'No' and missing values are the same availability
+    column = df.columns[5]
+    missing = df.copy()
+    missing[column] = missing[column].where(missing[column] != 'No')
+    assert missing[column].isna().any()
+    assert dataframe_key(missing) == dataframe_key(df)
+
+    changed = df.copy()
+    changed[column] = changed[column].where(changed[column] != 'Yes', 'Preferably Not')
+    assert dataframe_key(changed) != dataframe_key(df)
+
+
+def test_schedule_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)  # generate_schedule writes to output/ of the current directory
+    df = generate_instance(10, 5, seed=3)
+    cache = MemoryCache()
+
+    first = scheduler.generate_schedule(df, suffix='first', cache=cache, engine='bnb')
+    assert "Found the schedule in the cache" not in capsys.readouterr().out
+    second = scheduler.generate_schedule(df, suffix='second', cache=cache, engine='bnb')
+    assert "Found the schedule in the cache" in capsys.readouterr().out
+    assert second["TA"].tolist() == first["TA"].tolist()
+    assert second.attrs["optimal"] == first.attrs["optimal"]
+
+    # other parameters are a miss, but find the model
+    scheduler.generate_schedule(df, suffix='third', cache=cache, engine='cbj')
+    output = capsys.readouterr().out
+    assert "Found the schedule in the cache" not in output
+    assert "Found the preprocessed model in the cache" in output
+
+    # a schedule with only an absolute deadline is never cached
+    n_entries = len(cache.entries)
+    scheduler.generate_schedule(df, suffix='fourth', cache=cache, engine='bnb', deadline=time.time() + 60)
+    assert "Found the schedule in the cache" not in capsys.readouterr().out
+    assert len(cache.entries) == n_entries
+
+
+def test_schedule_cache_on_disk(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    df = generate_instance(10, 5, seed=4)
+    scheduler.generate_schedule(df, suffix='first', cache_dir='cache', time_limit=60)
+    capsys.readouterr()
+    scheduler.generate_schedule(df, suffix='second', cache_dir='cache', time_limit=60)
+    assert "Found the schedule in the cache" in capsys.readouterr().out
+    scheduler.generate_schedule(df, suffix='third', cache_dir='cache', time_limit=30)
+    assert "Found the schedule in the cache" not in capsys.readouterr().out
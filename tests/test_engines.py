@@ -0,0 +1,145 @@
+import itertools
+import numpy as np
+import pytest
+import scheduler
+from model import NO
+from search import BranchAndBound
+from symmetry import pool_interchangeable, split_pooled
+from benchmark.generator import generate_instance
+
+'''
+    The exact engines against brute force: on small random instances every schedule is enumerated, and every
+    engine that searches all schedules must find a schedule with the best score (most consecutive shifts, then
+    fewest 'Preferably Not'), also on the pooled and reduced model of build_model. In first-solution mode the
+    engines must find a valid schedule above the consecutive ratio exactly when one exists. The 'flow' engine
+    must find a schedule with the fewest 'Preferably Not' through find_schedule, so on its own model, and large
+    neighbourhood search ('lns') a valid schedule that is never better than the best one. Half of the instances
+    have two TAs with 1 shift and the same availability, which are pooled (see *symmetry.py*) without changing
+    the best score.
+'''
+
+INSTANCES = [(seed, pooled) for pooled in (False, True) for seed in range(12)]
+CONSECUTIVE_RATIO = 0.3
+
+
+def instance(seed, pooled):
+    if pooled:
+        df = generate_instance(n_groups=8, n_tas=4, seed=seed, shift_distribution=[3, 3, 1, 1])
+        df[df.columns[-1]] = df[df.columns[-2]]
+    else:
+        df = generate_instance(n_groups=8, n_tas=4, seed=seed)
+    return df, scheduler.create_schedule_model(df)
+
+
+def all_schedules(model):
+    """
+    matrix (schedules x groups) of TA indices of every valid schedule
+    """
+    domains = [np.flatnonzero(model.availability[group] != NO) for group in range(model.n_groups)]
+    assignments = np.array(list(itertools.product(*domains)), dtype=np.int64).reshape(-1, model.n_groups)
+    counts = np.stack([(assignments == person).sum(axis=1) for person in range(model.n_persons)], axis=1)
+    valid = (counts == model.n_shifts).all(axis=1)
+    for i, j in model.incompatible:
+        valid &= assignments[:, i] != assignments[:, j]
+    return assignments[valid]
+
+
+def score(model, solution):
+    assignment = model.to_indices(solution)
+    return model.consecutive_count(assignment), -model.preferably_not_count(assignment)
+
+
+def best_score(model):
+    schedules = all_schedules(model)
+    if not len(schedules):
+        return None
+    return max(zip(model.consecutive_counts(schedules).tolist(), (-model.preferably_not_counts(schedules)).tolist()))
+
+
+def is_valid(model, solution):
+    assignment = model.to_indices(solution)
+    return any((schedule == assignment).all() for schedule in all_schedules(model))
+
+
+@pytest.mark.parametrize("seed, pooled", INSTANCES)
+@pytest.mark.parametrize("engine", ['bnb', 'cbj', 'csp'])
+def test_best_schedule(seed, pooled, engine):
+    df, model = instance(seed, pooled)
+    solution = scheduler.extract_schedule(model, True, CONSECUTIVE_RATIO, engine=engine)
+    expected = best_score(model)
+    if expected is None:
+        assert solution is None
+    else:
+        assert is_valid(model, solution)
+        assert score(model, solution) == expected
+
+
+@pytest.mark.parametrize("seed, pooled", INSTANCES)
+def test_reduced_model(seed, pooled):
+    df, model = instance(seed, pooled)
+    expected = best_score(model)
+    if expected is None:
+        with pytest.raises(SystemExit):
+            scheduler.build_model(df)
+        return
+    reduced, pools, complete = scheduler.build_model(df)
+    assert complete
+    assert bool(pools) == pooled
+    solution = split_pooled(scheduler.extract_schedule(reduced, True, CONSECUTIVE_RATIO, engine='bnb'), pools)
+    assert is_valid(model, solution)
+    assert score(model, solution) == expected
+
+
+@pytest.mark.parametrize("seed, pooled", INSTANCES)
+@pytest.mark.parametrize("engine", ['cbj', 'csp'])
+def test_first_schedule(seed, pooled, engine):
+    df, model = instance(seed, pooled)
+    schedules = all_schedules(model)
+    exists = model.n_plus1shift > 0 and bool(len(schedules)) and \
+        model.consecutive_counts(schedules).max() / model.n_plus1shift > CONSECUTIVE_RATIO
+    solution = scheduler.extract_schedule(model, False, CONSECUTIVE_RATIO, engine=engine)
+    if not exists:
+        assert solution is None
+    else:
+        assert is_valid(model, solution)
+        assert score(model, solution)[0] / model.n_plus1shift > CONSECUTIVE_RATIO
+
+
+@pytest.mark.parametrize("seed, pooled", INSTANCES)
+def test_flow_schedule(seed, pooled):
+    df, model = instance(seed, pooled)
+    schedules = all_schedules(model)
+    if not len(schedules):
+        with pytest.raises(SystemExit):
+            scheduler.find_schedule(df, 9, None, CONSECUTIVE_RATIO, 'flow', 1, None)
+        return
+    solution, optimal, fallbacks = scheduler.find_schedule(df, 9, None, CONSECUTIVE_RATIO, 'flow', 1, None)
+    assert is_valid(model, solution)
+    assert -score(model, solution)[1] == model.preferably_not_counts(schedules).min()
+
+
+@pytest.mark.parametrize("seed, pooled", INSTANCES)
+def test_lns_schedule(seed, pooled):
+    df, model = instance(seed, pooled)
+    solution = scheduler.extract_lns_solution(model, time_limit=0.1)
+    expected = best_score(model)
+    if expected is None:
+        assert solution is None
+    else:
+        assert is_valid(model, solution)
+        assert score(model, solution) <= expected
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_pooled_schedule(seed):
+    df, model = instance(seed, True)
+    pooled_model, pools = pool_interchangeable(model)
+    assert len(pools) == 1 and pooled_model.n_persons == model.n_persons - 1
+    solution = BranchAndBound(pooled_model).solve()
+    expected = best_score(model)
+    if expected is None:
+        assert solution is None
+    else:
+        solution = split_pooled(solution, pools)
+        assert is_valid(model, solution)
+        assert score(model, solution) == expected
@@ -0,0 +1,117 @@
+import os
+import sys
+import pickle
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from model import AVAILABILITY_CODES
+
+'''
+    Reading the availability and writing schedules, without Excel on the hot path.
+
+    The availability can be an Excel workbook (.xlsx), or a CSV (.csv), Parquet (.parquet) or Arrow IPC
+    (.arrow, .feather) file with the same columns. Parquet and Arrow need the pyarrow package. In all formats
+    the availability of a TA can be written out ('Yes', 'Preferably Not', 'No') or as codes (2, 1, 0, see
+    *model.py*), and it is returned as a categorical column.
+
+    Parsing a workbook with openpyxl is slow, so the parsed dataframe is kept next to the workbook in a binary
+    snapshot (<workbook>.snapshot), which is read instead as long as the workbook hasn't changed since.
+
+    Schedules are written with the streaming (write-only) mode of openpyxl, in the same layout as
+    DataFrame.to_excel but without its cell styles, which takes a fraction of the time.
+'''
+
+AVAILABILITY_DTYPE = pd.CategoricalDtype(list(AVAILABILITY_CODES))
+SNAPSHOT_EXTENSION = '.snapshot'
+
+
+def read_availability(path, sheet_name=0, snapshot=True):
+    """
+    read the availability dataframe from path (.xlsx, .csv, .parquet, .arrow or .feather).
+    snapshot: keep a binary snapshot of a parsed workbook, and read it instead while the workbook is unchanged
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        df = pd.read_csv(path)
+    elif extension in ('.parquet', '.arrow', '.feather'):
+        try:
+            df = pd.read_parquet(path) if extension == '.parquet' else pd.read_feather(path)
+        except ImportError:
+            sys.exit(f'Reading "{path}" requires the pyarrow package (pip install pyarrow)')
+    elif snapshot:
+        df = _read_workbook_snapshot(path, sheet_name)
+    else:
+        df = pd.read_excel(path, sheet_name=sheet_name)
+    return availability_categories(df)
+
+
+def availability_categories(df):
+    """
+    store the availability columns (from column 6 onwards) as categorical columns, codes are converted to
+    answers. Columns with other values are left as they are, so check_input_range (see *scheduler.py*)
+    can report them
+    """
+    answers = {code: answer for answer, code in AVAILABILITY_CODES.items()}
+    df = df.copy()
+    for column in df.columns[5:]:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and values.dropna().isin(list(answers)).all():
+            values = values.map(answers)
+        if values.dropna().isin(AVAILABILITY_DTYPE.categories).all():
+            df[column] = values.astype(AVAILABILITY_DTYPE)
+    return df
+
+
+def snapshot_path(path):
+    return path + SNAPSHOT_EXTENSION
+
+
+def _read_workbook_snapshot(path, sheet_name):
+    """
+    the dataframe of a sheet of a workbook, from its snapshot if the workbook hasn't changed since
+    """
+    status = os.stat(path)
+    source = (status.st_size, status.st_mtime_ns, sheet_name)
+    try:
+        with open(snapshot_path(path), 'rb') as file:
+            snapshot = pickle.load(file)
+        if snapshot["source"] == source:
+            return snapshot["dataframe"]
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+        pass
+
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    data = pickle.dumps({"source": source, "dataframe": df}, protocol=pickle.HIGHEST_PROTOCOL)
+    # write to a temporary file first, so other runs never read half a snapshot
+    temporary_path = f'{snapshot_path(path)}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'wb') as file:
+            file.write(data)
+        os.replace(temporary_path, snapshot_path(path))
+    except OSError:
+        pass  # e.g. a read-only directory, the workbook is parsed again next time
+    return df
+
+
+def write_workbook(df, path):
+    """
+    write the dataframe to an Excel workbook with the index in the first column, as DataFrame.to_excel,
+    streaming the rows with the write-only mode of openpyxl
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append([None] + [str(column) for column in df.columns])
+    for index, row in zip(df.index, df.itertuples(index=False, name=None)):
+        sheet.append([_cell(index)] + [_cell(value) for value in row])
+    workbook.save(path)
+
+
+def _cell(value):
+    """
+    value as openpyxl can write it: numpy scalars as Python values, and missing values as empty cells
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if not isinstance(value, (list, tuple, dict)) and pd.isna(value):
+        return None
+    return value